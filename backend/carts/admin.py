@@ -35,6 +35,9 @@ class CartItemInline(admin.TabularInline):
     def get_total_price_display(self, obj):
         # отображение общей стоимости позиции
         return f'{obj.get_total_price()} ₽'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product').defer('product__search_vector')
 
 
 @admin.register(Cart)
@@ -58,18 +61,19 @@ class CartAdmin(SimpleHistoryAdmin):
         url = reverse('admin:users_user_change', args=[obj.user.id])
         return format_html('<a href="{}">{}</a>', url, obj.user.email)
     
-    @display(description=_('количество товаров'))
+    @display(description=_('количество товаров'), ordering='items_count')
     def get_total_items(self, obj):
-        # получение общего количества товаров в корзине
-        return obj.items.count()
+        # количество позиций из аннотации with_totals()
+        return obj.get_total_items()
     
-    @display(description=_('общая сумма'))
+    @display(description=_('общая сумма'), ordering='items_total')
     def get_total_price_display(self, obj):
         # отображение общей суммы с валютой
         return f'{obj.get_total_price()} ₽'
     
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('items', 'user')
+        # суммы и количества считаются в запросе списка, а не по строке
+        return super().get_queryset(request).with_totals().select_related('user')
 
 
 @admin.register(CartItem)
@@ -110,4 +114,4 @@ class CartItemAdmin(SimpleHistoryAdmin):
         return f'{obj.get_total_price()} ₽'
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('cart', 'cart__user', 'product')
+        return super().get_queryset(request).select_related('cart', 'cart__user', 'product').defer('product__search_vector')
@@ -0,0 +1,79 @@
+"""
+гостевые корзины в кэше и их перенос в корзину пользователя при входе
+"""
+import re
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from products.models import Product
+from .models import CartItem
+from .operations import fold_operations
+
+GUEST_CART_HEADER = 'X-Cart-Token'
+GUEST_CART_KEY_PREFIX = 'carts:guest:'
+TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{20,64}$')
+
+
+class GuestCart:
+    """
+    Anonymous cart kept in the cache under a client-held token.
+
+    The cart is a {product id: quantity} map; browsing and editing it never
+    touch the database except to read products. The token is issued on the
+    first change and sent back by the client in the X-Cart-Token header.
+    """
+
+    def __init__(self, token=None):
+        # чужой или испорченный токен не используется как ключ кэша
+        self.token = token if token and TOKEN_RE.match(token) else None
+        self.quantities = {}
+        if self.token:
+            self.quantities = cache.get(self.get_cache_key(), {})
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(request.headers.get(GUEST_CART_HEADER))
+
+    def get_cache_key(self):
+        return f'{GUEST_CART_KEY_PREFIX}{self.token}'
+
+    def apply(self, operations):
+        # применение операций пакета; итоговые нулевые количества удаляются
+        quantities = fold_operations(self.quantities, operations)
+        self.quantities = {
+            product_id: quantity for product_id, quantity in quantities.items() if quantity > 0
+        }
+
+    def save(self):
+        # каждое сохранение продлевает жизнь корзины
+        if self.token is None:
+            self.token = secrets.token_urlsafe(32)
+        cache.set(self.get_cache_key(), self.quantities, timeout=settings.GUEST_CART_TIMEOUT)
+
+    def clear(self):
+        if self.token:
+            cache.delete(self.get_cache_key())
+        self.quantities = {}
+
+    def get_items(self):
+        # несохранённые позиции с товарами одним запросом, в порядке добавления;
+        # товары, удалённые из каталога, пропускаются
+        products = Product.objects.select_related('main_image').defer('description').in_bulk(
+            list(self.quantities)
+        )
+        return [
+            CartItem(product=products[product_id], quantity=quantity)
+            for product_id, quantity in self.quantities.items()
+            if product_id in products
+        ]
+
+
+def merge_guest_cart(user, token):
+    """Move a guest cart into the user's cart with one upsert and drop it from the cache."""
+    guest_cart = GuestCart(token)
+    if not guest_cart.quantities:
+        return []
+    items = CartItem.objects.add_products(user, guest_cart.quantities)
+    guest_cart.clear()
+    return items
@@ -1,13 +1,39 @@
 """
 модели приложения корзины
 """
-from django.db import models
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 from django.contrib.admin import display
 from simple_history.models import HistoricalRecords
 
 
+# сумма позиции корзины в SQL: количество на текущую цену товара
+ITEMS_TOTAL_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def items_total(prefix=''):
+    # выражение суммы позиций, prefix — путь до позиций корзины
+    return Coalesce(
+        Sum(F(f'{prefix}quantity') * F(f'{prefix}product__price'), output_field=ITEMS_TOTAL_FIELD),
+        Value(Decimal('0.00')),
+        output_field=ITEMS_TOTAL_FIELD
+    )
+
+
+class CartQuerySet(models.QuerySet):
+    # набор запросов для корзин
+    
+    def with_totals(self):
+        # число позиций и сумма корзины одним агрегатом в запросе корзин
+        return self.annotate(items_count=Count('items'), items_total=items_total('items__'))
+
+
 class Cart(models.Model):
     # модель корзины покупок
     user = models.OneToOneField(
@@ -22,6 +48,8 @@ class Cart(models.Model):
     # отслеживание истории изменений через simple_history
     history = HistoricalRecords()
     
+    objects = CartQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'корзина'
         verbose_name_plural = 'корзины'
@@ -31,13 +59,18 @@ class Cart(models.Model):
     
     @display(description='количество товаров')
     def get_total_items(self):
-        # получение общего количества товаров в корзине
-        return self.items.count()
+        # количество позиций: из аннотации with_totals() или одним запросом
+        count = getattr(self, 'items_count', None)
+        if count is None:
+            count = self.items.count()
+        return count
     
     @display(description='общая сумма')
     def get_total_price(self):
-        # получение общей суммы товаров в корзине
-        total = sum(item.get_total_price() for item in self.items.all())
+        # сумма корзины: из аннотации with_totals() или одним агрегатом
+        total = getattr(self, 'items_total', None)
+        if total is None:
+            total = self.items.aggregate(total=items_total())['total']
         return total
     
     @display(description='общая сумма')
@@ -46,6 +79,103 @@ class Cart(models.Model):
         return f'{self.get_total_price()} ₽'
 
 
+# добавление в корзину одним запросом: корзина создаётся при первом добавлении,
+# количество существующих позиций увеличивается на стороне базы не выше предела;
+# товары, удалённые к моменту записи, пропускаются соединением с таблицей товаров,
+# а строка корзины возвращается и тогда, когда ни одна позиция не записана
+ADD_TO_CART_SQL = '''
+    WITH cart AS (
+        INSERT INTO {carts} (user_id, created_at, updated_at)
+        VALUES (%(user_id)s, %(now)s, %(now)s)
+        ON CONFLICT (user_id) DO UPDATE SET updated_at = EXCLUDED.updated_at
+        RETURNING id, xmax = 0 AS created
+    ), added AS (
+        INSERT INTO {items} (cart_id, product_id, quantity, created_at, updated_at)
+        SELECT cart.id, requested.product_id, requested.quantity, %(now)s, %(now)s
+        FROM cart
+        CROSS JOIN unnest(%(product_ids)s::bigint[], %(quantities)s::integer[])
+            AS requested(product_id, quantity)
+        JOIN {products} product ON product.id = requested.product_id
+        ORDER BY requested.product_id
+        ON CONFLICT (cart_id, product_id) DO UPDATE
+            SET quantity = LEAST({items}.quantity::bigint + EXCLUDED.quantity, %(max_quantity)s),
+                updated_at = EXCLUDED.updated_at
+        RETURNING id, product_id, quantity, created_at, xmax = 0 AS created
+    )
+    SELECT cart.id, cart.created, added.id, added.product_id, added.quantity, added.created_at, added.created
+    FROM cart
+    LEFT JOIN added ON TRUE
+'''
+
+
+class CartItemQuerySet(models.QuerySet):
+    # набор запросов для позиций корзины
+    
+    def add_products(self, user, quantities):
+        # атомарное добавление товаров {id товара: количество}: параллельные запросы
+        # складывают количество, а не теряют его и не упираются в уникальность (корзина, товар)
+        # количество ограничивается до записи, чтобы не переполнить integer[]
+        max_quantity = settings.CART_ITEM_MAX_QUANTITY
+        quantities = {
+            product_id: min(quantity, max_quantity)
+            for product_id, quantity in quantities.items() if quantity > 0
+        }
+        if not quantities:
+            return []
+        quote = connection.ops.quote_name
+        now = timezone.now()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                ADD_TO_CART_SQL.format(
+                    carts=quote(Cart._meta.db_table),
+                    items=quote(self.model._meta.db_table),
+                    products=quote(self.model._meta.get_field('product').related_model._meta.db_table),
+                ),
+                {
+                    'user_id': user.pk,
+                    'product_ids': list(quantities),
+                    'quantities': list(quantities.values()),
+                    'max_quantity': max_quantity,
+                    'now': now,
+                }
+            )
+            rows = cursor.fetchall()
+            
+            created, updated = [], []
+            for cart_id, cart_created, item_id, product_id, quantity, created_at, item_created in rows:
+                if item_id is None:
+                    # ни один товар не записан: строка несёт только корзину
+                    continue
+                item = self.model(
+                    id=item_id, cart_id=cart_id, product_id=product_id, quantity=quantity,
+                    created_at=created_at, updated_at=now
+                )
+                (created if item_created else updated).append(item)
+            # raw SQL не отправляет сигналы, поэтому история пишется явно
+            if cart_created:
+                Cart.history.bulk_history_create(
+                    [Cart(id=cart_id, user=user, created_at=now, updated_at=now)],
+                    default_user=user, default_date=now
+                )
+            if created:
+                self.model.history.bulk_history_create(created, default_user=user, default_date=now)
+            if updated:
+                self.model.history.bulk_history_create(
+                    updated, update=True, default_user=user, default_date=now
+                )
+        return created + updated
+    
+    def add_to_cart(self, user, product, quantity=1):
+        # добавление одного товара, возвращается итоговая позиция корзины
+        # или None, если товар удалён после проверки запроса
+        items = self.add_products(user, {product.pk: quantity})
+        if not items:
+            return None
+        item, = items
+        item.product = product
+        return item
+
+
 class CartItem(models.Model):
     # модель товара в корзине
     cart = models.ForeignKey(
@@ -71,6 +201,8 @@ class CartItem(models.Model):
     # отслеживание истории изменений через simple_history
     history = HistoricalRecords()
     
+    objects = CartItemQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'товар в корзине'
         verbose_name_plural = 'товары в корзине'
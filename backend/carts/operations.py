@@ -0,0 +1,83 @@
+"""
+пакетное изменение корзины
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+from .models import Cart, CartItem
+
+ADD = 'add'
+REMOVE = 'remove'
+SET = 'set'
+OPERATIONS = (ADD, REMOVE, SET)
+
+
+def fold_operations(quantities, operations):
+    # итоговые количества товаров после последовательного применения операций;
+    # повторные add не поднимают количество выше предела позиции
+    quantities = dict(quantities)
+    for operation in operations:
+        product_id = operation['product']
+        if operation['op'] == ADD:
+            quantities[product_id] = min(
+                quantities.get(product_id, 0) + operation.get('quantity', 1),
+                settings.CART_ITEM_MAX_QUANTITY
+            )
+        elif operation['op'] == SET:
+            quantities[product_id] = operation['quantity']
+        else:
+            quantities[product_id] = 0
+    return quantities
+
+
+def apply_cart_operations(user, operations):
+    """
+    Apply add, remove and set operations to the user's cart in one transaction.
+
+    The cart row is locked, the affected items are read with one query and
+    the final quantities are written with at most one bulk insert, one
+    bulk update and one delete, each with its history records.
+    """
+    product_ids = {operation['product'] for operation in operations}
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=user)
+        # блокировка корзины упорядочивает пакет с add_to_cart, который тоже обновляет её строку
+        Cart.objects.select_for_update().filter(pk=cart.pk).values_list('pk').get()
+        items = {
+            item.product_id: item
+            for item in CartItem.objects.filter(cart=cart, product_id__in=product_ids)
+        }
+        quantities = fold_operations(
+            {product_id: item.quantity for product_id, item in items.items()}, operations
+        )
+
+        now = timezone.now()
+        to_create, to_update, to_delete = [], [], []
+        for product_id, quantity in quantities.items():
+            item = items.get(product_id)
+            if item is None:
+                if quantity > 0:
+                    to_create.append(CartItem(
+                        cart=cart, product_id=product_id, quantity=quantity,
+                        created_at=now, updated_at=now
+                    ))
+            elif quantity <= 0:
+                to_delete.append(item.pk)
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                item.updated_at = now
+                to_update.append(item)
+
+        if to_create:
+            bulk_create_with_history(to_create, CartItem, default_user=user, default_date=now)
+        if to_update:
+            bulk_update_with_history(
+                to_update, CartItem, ['quantity', 'updated_at'], default_user=user, default_date=now
+            )
+        if to_delete:
+            # удаление через QuerySet отправляет post_delete, история удаления пишется сигналом
+            CartItem.objects.filter(pk__in=to_delete).delete()
+        if to_create or to_update or to_delete:
+            Cart.objects.filter(pk=cart.pk).update(updated_at=now)
+    return cart
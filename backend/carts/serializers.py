@@ -1,17 +1,21 @@
 """
 Serializers for carts app.
 """
+from decimal import Decimal
+
+from django.conf import settings
 from rest_framework import serializers
 from .models import Cart, CartItem
-from products.serializers import ProductSerializer
+from .operations import ADD, OPERATIONS, SET
+from products.serializers import ProductSummarySerializer
 from products.models import Product
 
 
 class CartItemSerializer(serializers.ModelSerializer):
     """Serializer for CartItem model."""
-    product = ProductSerializer(read_only=True)
+    product = ProductSummarySerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
-        queryset=Product.objects.all(),
+        queryset=Product.objects.select_related('main_image'),
         source='product',
         write_only=True
     )
@@ -24,6 +28,7 @@ class CartItemSerializer(serializers.ModelSerializer):
             'total_price', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        extra_kwargs = {'quantity': {'max_value': settings.CART_ITEM_MAX_QUANTITY}}
     
     def get_total_price(self, obj):
         """Calculate total price for item."""
@@ -44,10 +49,67 @@ class CartSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at', 'user']
     
+    def get_total_items(self, obj):
+        """Get total number of items, annotated by CartViewSet when available."""
+        return obj.get_total_items()
+    
+    def get_total_price(self, obj):
+        """Get total cart price, annotated by CartViewSet when available."""
+        return str(obj.get_total_price())
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """Serializer for a single cart batch operation."""
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(
+        min_value=0, max_value=settings.CART_ITEM_MAX_QUANTITY, required=False
+    )
+    
+    def validate(self, attrs):
+        """Require a positive quantity for add and a quantity for set."""
+        if attrs['op'] == SET and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'This field is required for set.'})
+        if attrs['op'] == ADD and attrs.get('quantity', 1) < 1:
+            raise serializers.ValidationError({'quantity': 'Must be at least 1 for add.'})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """Serializer for a list of cart operations applied in one transaction."""
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+    
+    def validate_operations(self, operations):
+        """Check that all referenced products exist with one query."""
+        product_ids = {operation['product'] for operation in operations}
+        existing = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+        missing = sorted(product_ids - existing)
+        if missing:
+            raise serializers.ValidationError(
+                f'Unknown products: {", ".join(map(str, missing))}.'
+            )
+        return operations
+
+
+class GuestCartItemSerializer(CartItemSerializer):
+    """Serializer for an item of a cache-backed guest cart."""
+    
+    class Meta(CartItemSerializer.Meta):
+        fields = ['product', 'quantity', 'total_price']
+        read_only_fields = fields
+
+
+class GuestCartSerializer(serializers.Serializer):
+    """Serializer for a guest cart given as {'token': ..., 'items': [unsaved CartItem]}."""
+    token = serializers.CharField(read_only=True, allow_null=True)
+    items = GuestCartItemSerializer(many=True, read_only=True)
+    total_items = serializers.SerializerMethodField()
+    total_price = serializers.SerializerMethodField()
+    
     def get_total_items(self, obj):
         """Get total number of items."""
-        return obj.items.count()
+        return len(obj['items'])
     
     def get_total_price(self, obj):
         """Calculate total cart price."""
-        return str(obj.get_total_price())
+        return str(sum((item.get_total_price() for item in obj['items']), Decimal('0.00')))
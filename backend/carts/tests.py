@@ -0,0 +1,260 @@
+"""
+тесты приложения корзины
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+from products.models import Product
+from .guest import GuestCart
+from .models import Cart, CartItem
+from .operations import fold_operations
+
+
+class AddToCartTests(TestCase):
+    # добавление одним upsert создаёт корзину и позиции и пишет их историю
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', password='p')
+        self.product = Product.objects.create(name='Чайник', sku='CART-1', price=Decimal('100.00'))
+
+    def test_first_add_creates_cart(self):
+        item = CartItem.objects.add_to_cart(self.user, self.product, 2)
+
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((item.cart_id, item.quantity), (cart.pk, 2))
+        self.assertEqual(list(cart.history.values_list('history_type', flat=True)), ['+'])
+        self.assertEqual(
+            list(CartItem.history.filter(id=item.pk).values_list('history_type', 'quantity')),
+            [('+', 2)]
+        )
+
+    def test_add_to_existing_item_increments_quantity(self):
+        first = CartItem.objects.add_to_cart(self.user, self.product, 2)
+        second = CartItem.objects.add_to_cart(self.user, self.product, 3)
+
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(CartItem.objects.get(pk=first.pk).quantity, 5)
+        self.assertEqual(
+            list(CartItem.history.filter(id=first.pk).order_by('history_id').values_list(
+                'history_type', 'quantity'
+            )),
+            [('+', 2), ('~', 5)]
+        )
+        # корзина создаётся один раз
+        self.assertEqual(Cart.history.filter(id=first.cart_id).count(), 1)
+
+    def test_api_add_returns_item(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        for quantity in (1, 2):
+            response = client.post(
+                '/api/v1/cart-items/', {'product_id': self.product.pk, 'quantity': quantity}, format='json'
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['quantity'], 3)
+        self.assertEqual(response.data['product']['id'], self.product.pk)
+
+
+class CartBatchTests(TestCase):
+    # пакет операций сворачивается в итоговые количества и применяется целиком
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', password='p')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.kettle = Product.objects.create(name='Чайник', sku='CART-1', price=Decimal('100.00'))
+        self.toaster = Product.objects.create(name='Тостер', sku='CART-2', price=Decimal('50.00'))
+        self.mug = Product.objects.create(name='Кружка', sku='CART-3', price=Decimal('10.00'))
+
+    def batch(self, *operations):
+        return self.client.post('/api/v1/cart/batch/', {'operations': list(operations)}, format='json')
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+
+    def test_fold_operations_in_order(self):
+        operations = [
+            {'op': 'add', 'product': 1, 'quantity': 2},
+            {'op': 'add', 'product': 1},
+            {'op': 'set', 'product': 2, 'quantity': 4},
+            {'op': 'remove', 'product': 3},
+            {'op': 'add', 'product': 3, 'quantity': 1},
+        ]
+
+        self.assertEqual(fold_operations({3: 5}, operations), {1: 3, 2: 4, 3: 1})
+
+    def test_operations_on_same_product(self):
+        CartItem.objects.add_to_cart(self.user, self.toaster, 1)
+        CartItem.objects.add_to_cart(self.user, self.mug, 2)
+
+        response = self.batch(
+            {'op': 'add', 'product': self.kettle.pk, 'quantity': 2},
+            {'op': 'set', 'product': self.kettle.pk, 'quantity': 5},
+            {'op': 'add', 'product': self.kettle.pk},
+            {'op': 'add', 'product': self.toaster.pk, 'quantity': 2},
+            {'op': 'remove', 'product': self.toaster.pk},
+            {'op': 'set', 'product': self.mug.pk, 'quantity': 7},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.kettle.pk: 6, self.mug.pk: 7})
+        self.assertEqual(response.data['total_items'], 2)
+        self.assertEqual(response.data['total_price'], '670.00')
+        # удаление и изменение записаны в историю
+        self.assertTrue(CartItem.history.filter(product_id=self.toaster.pk, history_type='-').exists())
+        self.assertTrue(CartItem.history.filter(
+            product_id=self.mug.pk, history_type='~', quantity=7
+        ).exists())
+
+    def test_unknown_product_rejects_whole_batch(self):
+        CartItem.objects.add_to_cart(self.user, self.kettle, 1)
+        missing_id = Product.objects.order_by('-pk').values_list('pk', flat=True).first() + 1
+
+        response = self.batch(
+            {'op': 'add', 'product': self.kettle.pk, 'quantity': 3},
+            {'op': 'add', 'product': missing_id},
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(missing_id), str(response.data['operations']))
+        self.assertEqual(self.quantities(), {self.kettle.pk: 1})
+
+
+class GuestCartTests(TestCase):
+    # гостевая корзина живёт в кэше под токеном и переносится в корзину при входе
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', password='p')
+        self.client = APIClient()
+        self.kettle = Product.objects.create(name='Чайник', sku='CART-1', price=Decimal('100.00'))
+        self.toaster = Product.objects.create(name='Тостер', sku='CART-2', price=Decimal('50.00'))
+
+    def guest_batch(self, *operations, token=None):
+        headers = {'HTTP_X_CART_TOKEN': token} if token else {}
+        return self.client.post(
+            '/api/v1/cart/batch/', {'operations': list(operations)}, format='json', **headers
+        )
+
+    def login(self, token):
+        return self.client.post(
+            '/api/v1/auth/login/', {'email': 'buyer@example.com', 'password': 'p'},
+            format='json', HTTP_X_CART_TOKEN=token
+        )
+
+    def test_cache_round_trip(self):
+        response = self.guest_batch({'op': 'add', 'product': self.kettle.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 200)
+        token = response.headers['X-Cart-Token']
+        self.assertEqual(response.data['token'], token)
+
+        response = self.guest_batch({'op': 'add', 'product': self.toaster.pk}, token=token)
+        self.assertEqual(response.headers['X-Cart-Token'], token)
+
+        response = self.client.get('/api/v1/cart/', HTTP_X_CART_TOKEN=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['product']['id'], item['quantity']) for item in response.data['items']],
+            [(self.kettle.pk, 2), (self.toaster.pk, 1)]
+        )
+        self.assertEqual(response.data['total_price'], '250.00')
+        # гостевая корзина не пишет в базу
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_unknown_token_gives_empty_cart(self):
+        response = self.client.get('/api/v1/cart/', HTTP_X_CART_TOKEN='x' * 32)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], [])
+
+    def test_merge_into_existing_cart_on_login(self):
+        CartItem.objects.add_to_cart(self.user, self.kettle, 1)
+        response = self.guest_batch(
+            {'op': 'add', 'product': self.kettle.pk, 'quantity': 2},
+            {'op': 'add', 'product': self.toaster.pk, 'quantity': 3},
+        )
+        token = response.headers['X-Cart-Token']
+
+        response = self.login(token)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity')),
+            {self.kettle.pk: 3, self.toaster.pk: 3}
+        )
+        self.assertIsNone(cache.get(GuestCart(token).get_cache_key()))
+        self.assertEqual(GuestCart(token).quantities, {})
+
+        # повторный вход с тем же токеном ничего не добавляет
+        self.login(token)
+        self.assertEqual(CartItem.objects.get(cart__user=self.user, product=self.kettle).quantity, 3)
+
+
+class CartQuantityLimitTests(TestCase):
+    # количество позиции не выходит за предел ни через API, ни при накоплении
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', password='p')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(name='Чайник', sku='CART-1', price=Decimal('100.00'))
+        self.max_quantity = settings.CART_ITEM_MAX_QUANTITY
+
+    def batch(self, client, *operations):
+        return client.post('/api/v1/cart/batch/', {'operations': list(operations)}, format='json')
+
+    def test_oversized_quantity_is_rejected(self):
+        for op in ('add', 'set'):
+            with self.subTest(op=op):
+                response = self.batch(
+                    self.client, {'op': op, 'product': self.product.pk, 'quantity': 3000000000}
+                )
+                self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(
+            '/api/v1/cart-items/', {'product_id': self.product.pk, 'quantity': 3000000000}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+
+    def test_repeated_adds_stop_at_limit(self):
+        operation = {'op': 'add', 'product': self.product.pk, 'quantity': self.max_quantity}
+        response = self.batch(self.client, operation, operation)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'][0]['quantity'], self.max_quantity)
+
+        item = CartItem.objects.add_to_cart(self.user, self.product, self.max_quantity)
+        self.assertEqual(item.quantity, self.max_quantity)
+
+    def test_guest_cart_merge_clamps_quantity(self):
+        # корзина, записанная до появления предела, не мешает входу
+        guest_cart = GuestCart()
+        guest_cart.quantities = {self.product.pk: 3000000000}
+        guest_cart.save()
+
+        response = APIClient().post(
+            '/api/v1/auth/login/',
+            {'email': 'buyer@example.com', 'password': 'p'},
+            format='json',
+            HTTP_X_CART_TOKEN=guest_cart.token
+        )
+
+        self.assertEqual(response.status_code, 200)
+        item = CartItem.objects.get(cart__user=self.user, product=self.product)
+        self.assertEqual(item.quantity, self.max_quantity)
+        self.assertIsNone(cache.get(guest_cart.get_cache_key()))
+
+    def test_add_of_deleted_product_keeps_cart_history(self):
+        product = Product.objects.create(name='Тостер', sku='CART-2', price=Decimal('50.00'))
+        product_id = product.pk
+        product.delete()
+
+        self.assertEqual(CartItem.objects.add_products(self.user, {product_id: 1}), [])
+
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.history.filter(history_type='+').count(), 1)
+        self.assertIsNone(CartItem.objects.add_to_cart(self.user, product))
@@ -1,13 +1,22 @@
 """
 Views for carts app.
 """
-from rest_framework import viewsets, status
+from rest_framework import serializers, viewsets, status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.shortcuts import get_object_or_404
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.conf import settings
+from django.db.models import Prefetch
+from .guest import GUEST_CART_HEADER, GuestCart
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
+from .operations import apply_cart_operations
+from .serializers import (
+    CartBatchSerializer,
+    CartItemSerializer,
+    CartSerializer,
+    GuestCartSerializer,
+)
 
 
 class CartViewSet(viewsets.ModelViewSet):
@@ -15,19 +24,69 @@ class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
     
+    # гостевая корзина доступна без входа: просмотр и пакетное изменение
+    guest_actions = ('list', 'batch')
+    
+    def get_permissions(self):
+        if self.action in self.guest_actions:
+            return [AllowAny()]
+        return super().get_permissions()
+    
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        # корзина, позиции и краткие данные товаров — два запроса при любом числе позиций
+        items = CartItem.objects.select_related('product__main_image').defer(
+            'product__search_vector'
+        ).order_by('created_at', 'id')
+        return Cart.objects.filter(user=self.request.user).with_totals().prefetch_related(
+            Prefetch('items', queryset=items)
+        )
     
     def get_object(self):
         """Get or create cart for user."""
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
+        cart = self.get_queryset().first()
+        if cart is None:
+            cart, created = Cart.objects.get_or_create(user=self.request.user)
         return cart
     
     def list(self, request, *args, **kwargs):
-        """Get current user's cart."""
+        """Get current user's cart, or the guest cart named by X-Cart-Token."""
+        if not request.user.is_authenticated:
+            return self.get_guest_response(GuestCart.from_request(request))
         cart = self.get_object()
         serializer = self.get_serializer(cart)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'], serializer_class=CartBatchSerializer)
+    def batch(self, request):
+        """Apply add, remove and set operations in order and return the resulting cart."""
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+        if request.user.is_authenticated:
+            apply_cart_operations(request.user, operations)
+            return Response(CartSerializer(self.get_object(), context=self.get_serializer_context()).data)
+        
+        # гостевая корзина меняется только в кэше
+        guest_cart = GuestCart.from_request(request)
+        guest_cart.apply(operations)
+        if len(guest_cart.quantities) > settings.GUEST_CART_MAX_ITEMS:
+            return Response(
+                {'operations': [f'A guest cart holds at most {settings.GUEST_CART_MAX_ITEMS} items.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        guest_cart.save()
+        return self.get_guest_response(guest_cart)
+    
+    def get_guest_response(self, guest_cart):
+        """Render a guest cart and return its token in the X-Cart-Token header."""
+        data = GuestCartSerializer(
+            {'token': guest_cart.token, 'items': guest_cart.get_items()},
+            context=self.get_serializer_context()
+        ).data
+        response = Response(data)
+        if guest_cart.token:
+            response.headers[GUEST_CART_HEADER] = guest_cart.token
+        return response
 
 
 class CartItemViewSet(viewsets.ModelViewSet):
@@ -36,22 +95,21 @@ class CartItemViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return CartItem.objects.filter(cart__user=self.request.user)
+        return CartItem.objects.filter(cart__user=self.request.user).select_related(
+            'product__main_image'
+        ).defer('product__search_vector').order_by('created_at', 'id')
     
     def perform_create(self, serializer):
-        """Add item to cart."""
-        cart = get_object_or_404(Cart, user=self.request.user)
-        product = serializer.validated_data.get('product')
-        quantity = serializer.validated_data.get('quantity', 1)
-        
-        # Check if item already in cart
-        existing_item = CartItem.objects.filter(cart=cart, product=product).first()
-        if existing_item:
-            existing_item.quantity += quantity
-            existing_item.save()
-            return existing_item
-        
-        serializer.save(cart=cart)
+        """Add item to cart, creating the cart or increasing the quantity in one statement."""
+        product = serializer.validated_data['product']
+        serializer.instance = CartItem.objects.add_to_cart(
+            self.request.user, product, serializer.validated_data.get('quantity', 1)
+        )
+        if serializer.instance is None:
+            # товар удалён между проверкой запроса и записью
+            raise serializers.ValidationError(
+                {'product_id': [f'Invalid pk "{product.pk}" - object does not exist.']}
+            )
     
     def update(self, request, *args, **kwargs):
         """Update cart item quantity."""
@@ -60,8 +118,10 @@ class CartItemViewSet(viewsets.ModelViewSet):
         quantity = request.data.get('quantity')
         
         if quantity is not None:
-            instance.quantity = int(quantity)
-            instance.save()
+            # количество проверяется сериализатором до записи
+            quantity_serializer = self.get_serializer(instance, data={'quantity': quantity}, partial=True)
+            quantity_serializer.is_valid(raise_exception=True)
+            quantity_serializer.save()
         
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
@@ -0,0 +1,96 @@
+"""
+Conditional GET support for detail views.
+"""
+import hashlib
+from calendar import timegm
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import Subquery, TextField, Value
+from django.db.models.functions import MD5, Concat
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def related_digest(queryset, group_field, *fields):
+    """
+    Return a subquery hashing `fields` of the related rows in `queryset`.
+
+    `queryset` is correlated with the outer query (OuterRef) and grouped by
+    `group_field`; rows are concatenated in primary key order, so any edit,
+    insertion or deletion among them changes the digest.
+    """
+    parts = []
+    for field in fields:
+        parts += [field, Value('\x1f')]
+    digest = MD5(StringAgg(Concat(*parts, output_field=TextField()), '\x1e', order_by='pk'))
+    return Subquery(
+        queryset.order_by().values(group_field).annotate(digest=digest).values('digest')[:1],
+        output_field=TextField()
+    )
+
+
+class ConditionalGetMixin:
+    """
+    Add ETag and Last-Modified validators to `retrieve`.
+
+    The validators are computed from a single aggregate query returned by
+    `get_conditional_queryset` (a values() queryset covering the object and
+    the related rows it is rendered with). A request whose If-None-Match or
+    If-Modified-Since matches gets a 304 before the object is loaded or
+    serialized.
+
+    Last-Modified is the latest of `conditional_timestamp_fields`, so every
+    write that changes the representation must move one of them; related
+    writes bump the parent's `updated_at` for that. The ETag also covers
+    changes made within the same second.
+    """
+    # columns of the state row combined into Last-Modified
+    conditional_timestamp_fields = ('updated_at',)
+
+    def get_conditional_queryset(self):
+        """Return a values() queryset of the state the representation depends on."""
+        raise NotImplementedError
+
+    def get_conditional_extra(self):
+        """Return additional ETag input not stored in the database."""
+        return ()
+
+    def get_conditional_state(self):
+        """Fetch the state row of the requested object, or None if it is missing."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.get_conditional_queryset().filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        ).order_by()
+        rows = list(queryset[:1])
+        return rows[0] if rows else None
+
+    def get_validators(self, request, state):
+        """Return the (etag, last_modified) pair for the state row."""
+        timestamps = [
+            state[name] for name in self.conditional_timestamp_fields if state.get(name)
+        ]
+        last_modified = timegm(max(timestamps).utctimetuple()) if timestamps else None
+        # the representation also depends on the query parameters and the renderer
+        params = sorted(
+            (key, sorted(request.query_params.getlist(key))) for key in request.query_params
+        )
+        raw = repr((
+            sorted(state.items()), self.get_conditional_extra(), request.path, params,
+            request.accepted_renderer.format
+        ))
+        return quote_etag(hashlib.md5(raw.encode()).hexdigest()), last_modified
+
+    def retrieve(self, request, *args, **kwargs):
+        state = self.get_conditional_state()
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag, last_modified = self.get_validators(request, state)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response.headers['ETag'] = etag
+            if last_modified is not None:
+                response.headers['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,190 @@
+"""
+Pagination classes for the API.
+"""
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over a (field, id) pair.
+
+    Each page is fetched with a range condition on an index matching the
+    ordering instead of OFFSET, and no COUNT(*) is run. The ordering field
+    comes from the ordering query parameter when the view lists it in
+    `cursor_ordering_fields`; the primary key is always the tie-breaker.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    default_ordering = '-created_at'
+    default_ordering_fields = ('created_at',)
+    tiebreaker = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self.get_ordering(request, view)
+        model_field = queryset.model._meta.get_field(self.field)
+
+        position = self.decode_cursor(request, model_field)
+        reverse = position is not None and position['reverse']
+        # for the previous page the ordering and comparisons are flipped
+        descending = self.descending != reverse
+
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}{self.tiebreaker}')
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(position['value'], position['id'], descending)
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = results
+        return results
+
+    def get_ordering(self, request, view):
+        """Return the (field, descending) pair the page is ordered by."""
+        allowed = getattr(view, 'cursor_ordering_fields', self.default_ordering_fields)
+        ordering_param = getattr(view, 'ordering_param', OrderingFilter.ordering_param)
+
+        candidates = []
+        param = request.query_params.get(ordering_param)
+        if param:
+            candidates.append(param.split(',')[0].strip())
+        candidates.extend(getattr(view, 'ordering', None) or [])
+        candidates.append(self.default_ordering)
+
+        for term in candidates:
+            field = term.lstrip('-')
+            if field in allowed:
+                return field, term.startswith('-')
+        return self.default_ordering.lstrip('-'), self.default_ordering.startswith('-')
+
+    def get_position_filter(self, value, pk, descending):
+        """Build the condition selecting rows strictly after (value, pk)."""
+        if descending:
+            return Q(**{f'{self.field}__lte': value}) & ~Q(
+                **{self.field: value, f'{self.tiebreaker}__gte': pk}
+            )
+        return Q(**{f'{self.field}__gte': value}) & ~Q(
+            **{self.field: value, f'{self.tiebreaker}__lte': pk}
+        )
+
+    def decode_cursor(self, request, model_field):
+        """Decode the cursor query parameter, or return None for the first page."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            value = model_field.to_python(data['v'])
+            if value is None:
+                # ordering columns are NOT NULL; a null position cannot be compared
+                raise ValueError('null cursor value')
+            return {
+                'value': value,
+                'id': int(data['i']),
+                'reverse': bool(data.get('r')),
+            }
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        """Return a URL pointing at the page after (or before) the given item."""
+        value = self._get_value(item, self.field)
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        data = {'v': value, 'i': self._get_value(item, self.tiebreaker)}
+        if reverse:
+            data['r'] = 1
+        encoded = b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_value(self, item, name):
+        if isinstance(item, dict):
+            return item[name]
+        return getattr(item, name)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OptionalKeysetPagination(PageNumberPagination):
+    """
+    Page number pagination with opt-in keyset pagination.
+
+    Passing `?pagination=cursor` (or a `cursor` from a previous response)
+    switches the listing to KeysetPagination.
+    """
+    keyset_pagination_class = KeysetPagination
+    mode_query_param = 'pagination'
+    keyset_mode = 'cursor'
+
+    def use_keyset(self, request):
+        """Check whether the client opted into keyset pagination."""
+        return (
+            request.query_params.get(self.mode_query_param) == self.keyset_mode
+            or self.keyset_pagination_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
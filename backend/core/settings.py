@@ -3,6 +3,8 @@ import os
 from pathlib import Path
 from datetime import timedelta
 
+from corsheaders.defaults import default_headers
+
 # сборка путей внутри проекта: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -22,6 +24,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # сторонние приложения
     'rest_framework',
@@ -102,6 +105,54 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# кэш
+# локально используется locmem, в продакшене задаётся общий бэкенд (redis, memcached)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'onlinestore'),
+    }
+}
+
+# гостевые корзины хранятся только в кэше: время жизни (секунды) и число позиций
+GUEST_CART_TIMEOUT = 60 * 60 * 24 * 14
+GUEST_CART_MAX_ITEMS = 100
+
+# наибольшее количество одного товара в корзине: больше не принимается и не накапливается
+CART_ITEM_MAX_QUANTITY = 999
+
+# кэш ответов каталога (секунды); инвалидация идёт сменой версий ключей
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# автодополнение товаров: время жизни кэша подсказок (секунды) и их количество
+PRODUCT_SUGGEST_CACHE_TIMEOUT = 60
+PRODUCT_SUGGEST_LIMIT = 10
+
+# фасеты списка товаров: время жизни кэша (секунды)
+PRODUCT_FACETS_CACHE_TIMEOUT = 300
+
+# производные изображений товаров: размеры (максимальная сторона в пикселях),
+# качество webp и число фоновых потоков; при 0 потоков обработка синхронная
+PRODUCT_IMAGE_SIZES = {
+    'small': 160,
+    'medium': 480,
+    'large': 1200,
+}
+PRODUCT_IMAGE_QUALITY = 80
+PRODUCT_IMAGE_WORKERS = int(os.environ.get('PRODUCT_IMAGE_WORKERS', 2))
+
+# потоковая выгрузка каталога: размер пачки серверного курсора и данные магазина для yml
+PRODUCT_EXPORT_CHUNK_SIZE = 2000
+PRODUCT_FEED_SHOP_NAME = os.environ.get('PRODUCT_FEED_SHOP_NAME', 'Online Store')
+PRODUCT_FEED_COMPANY = os.environ.get('PRODUCT_FEED_COMPANY', 'Online Store')
+
+# «покупают вместе»: число соседей на товар и задержка (секунды), после которой
+# заказ считается завершённым и попадает в инкрементальный пересчёт
+RELATED_PRODUCTS_LIMIT = 10
+RELATED_PRODUCTS_SETTLE_SECONDS = 300
+
 # интернационализация
 LANGUAGE_CODE = 'ru'
 TIME_ZONE = 'UTC'
@@ -116,6 +167,12 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# обработчики загрузки считают sha256 файла по мере приёма данных
+FILE_UPLOAD_HANDLERS = [
+    'core.uploadhandlers.HashingMemoryFileUploadHandler',
+    'core.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
 # тип поля первичного ключа по умолчанию
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -153,6 +210,9 @@ SIMPLE_JWT = {
 
 # настройки cors
 CORS_ALLOW_ALL_ORIGINS = True
+# токен гостевой корзины передаётся заголовком
+CORS_ALLOW_HEADERS = (*default_headers, 'x-cart-token')
+CORS_EXPOSE_HEADERS = ['X-Cart-Token']
 
 # логирование
 LOGGING = {
@@ -0,0 +1,40 @@
+"""
+Upload handlers computing a content hash while the upload is received.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class ContentHashMixin:
+    """
+    Hash each uploaded file chunk by chunk as it arrives.
+
+    The SHA-256 hex digest is set as `content_hash` on the resulting
+    uploaded file, so models can deduplicate content without reading the
+    file a second time.
+    """
+    hash_algorithm = 'sha256'
+    
+    def new_file(self, *args, **kwargs):
+        # the memory handler stops later handlers from new_file, so set up first
+        self.hasher = hashlib.new(self.hash_algorithm)
+        super().new_file(*args, **kwargs)
+    
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+    
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(ContentHashMixin, MemoryFileUploadHandler):
+    """Keep small uploads in memory and hash them."""
+
+
+class HashingTemporaryFileUploadHandler(ContentHashMixin, TemporaryFileUploadHandler):
+    """Stream large uploads to a temporary file and hash them."""
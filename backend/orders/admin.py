@@ -156,4 +156,4 @@ class OrderItemAdmin(SimpleHistoryAdmin):
         return f'{obj.get_total_price()} ₽'
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('order', 'order__user', 'product')
+        return super().get_queryset(request).select_related('order', 'order__user', 'product').defer('product__search_vector')
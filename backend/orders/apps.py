@@ -0,0 +1,15 @@
+"""
+конфигурация приложения заказов
+"""
+from django.apps import AppConfig
+
+
+class OrdersConfig(AppConfig):
+    # конфигурация приложения заказов
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'orders'
+    verbose_name = 'заказы'
+    
+    def ready(self):
+        # подключение обработчиков сигналов
+        from . import signals  # noqa: F401
@@ -57,6 +57,10 @@ class Order(models.Model):
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
         ordering = ['-created_at']
+        indexes = [
+            # индекс под keyset-пагинацию заказов пользователя
+            models.Index(fields=['user', 'created_at', 'id'], name='orders_user_created_id_idx'),
+        ]
     
     def __str__(self):
         return f'заказ #{self.id} - {self.user.email}'
@@ -113,6 +117,11 @@ class OrderItem(models.Model):
     class Meta:
         verbose_name = 'товар в заказе'
         verbose_name_plural = 'товары в заказе'
+        indexes = [
+            # индексы под keyset-пагинацию позиций заказов
+            models.Index(fields=['created_at', 'id'], name='order_items_created_id_idx'),
+            models.Index(fields=['order', 'created_at', 'id'], name='order_items_order_created_idx'),
+        ]
     
     def __str__(self):
         return f'{self.product_name} x {self.quantity}'
@@ -0,0 +1,49 @@
+"""
+обработчики сигналов приложения заказов
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from users.models import Role, UserProfile, UserRole
+from .models import Order, OrderItem, OrderStatus
+
+# ответ заказа включает позиции, статус и пользователя с профилем и ролями;
+# их правки сдвигают дату изменения заказа, по которой отдаётся Last-Modified
+
+
+def touch_orders(**filters):
+    Order.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def touch_order_for_item(sender, instance, **kwargs):
+    touch_orders(pk=instance.order_id)
+
+
+@receiver(post_save, sender=OrderStatus)
+def touch_orders_for_status(sender, instance, created, **kwargs):
+    if not created:
+        touch_orders(status=instance)
+
+
+@receiver(post_save, sender=get_user_model())
+def touch_orders_for_user(sender, instance, created, update_fields=None, **kwargs):
+    # вход пользователя обновляет только last_login, которого нет в ответе
+    if not created and set(update_fields or ()) != {'last_login'}:
+        touch_orders(user=instance)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def touch_orders_for_user_relation(sender, instance, **kwargs):
+    touch_orders(user_id=instance.user_id)
+
+
+@receiver(post_save, sender=Role)
+def touch_orders_for_role(sender, instance, created, **kwargs):
+    if not created:
+        touch_orders(user__user_roles__role=instance)
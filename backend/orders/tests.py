@@ -0,0 +1,57 @@
+"""
+тесты приложения заказов
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from products.tests import ConditionalGetAssertions
+from rest_framework.test import APIClient
+from .models import Order, OrderItem, OrderStatus
+
+
+class OrderConditionalGetTests(ConditionalGetAssertions, TestCase):
+    # правки позиций, статуса и пользователя сдвигают дату изменения заказа
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', password='p')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.status = OrderStatus.objects.create(name='новый')
+        self.order = Order.objects.create(user=self.user, status=self.status, total=Decimal('50.00'))
+        self.items = [
+            OrderItem.objects.create(
+                order=self.order, product_name=name, product_sku=name,
+                price=Decimal('10.00'), quantity=quantity
+            )
+            for name, quantity in (('a', 2), ('b', 3))
+        ]
+        self.url = f'/api/v1/orders/{self.order.pk}/'
+    
+    def backdate(self):
+        Order.objects.filter(pk=self.order.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+    
+    def test_item_quantities_swapped(self):
+        # сумма количеств не меняется, меняется только содержимое позиций
+        def write():
+            for item, quantity in zip(self.items, (3, 2)):
+                item.quantity = quantity
+                item.save()
+        self.assertChanged(write)
+    
+    def test_status_renamed(self):
+        def write():
+            self.status.name = 'в обработке'
+            self.status.save()
+        self.assertChanged(write)
+    
+    def test_item_deleted(self):
+        self.assertChanged(self.items[1].delete)
+    
+    def test_user_renamed(self):
+        def write():
+            self.user.first_name = 'Иван'
+            self.user.save()
+        self.assertChanged(write)
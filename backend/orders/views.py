@@ -7,10 +7,14 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.db.models import OuterRef
 from .models import OrderStatus, Order, OrderItem
 from .serializers import OrderStatusSerializer, OrderSerializer, OrderItemSerializer
 from carts.models import Cart
+from core.conditional import ConditionalGetMixin, related_digest
+from core.pagination import OptionalKeysetPagination
 from products.models import Product
+from users.models import UserRole
 
 
 class OrderStatusViewSet(viewsets.ModelViewSet):
@@ -20,14 +24,33 @@ class OrderStatusViewSet(viewsets.ModelViewSet):
     permission_classes = []
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """ViewSet for Order model."""
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalKeysetPagination
     
     def get_queryset(self):
         return Order.objects.filter(user=self.request.user)
     
+    def get_conditional_queryset(self):
+        # позиции, статус и пользователь входят в ответ, но их правки
+        # не меняют updated_at заказа, поэтому их значения входят в ETag
+        return self.get_queryset().values(
+            'updated_at', 'total', 'status_id', 'status__name', 'status__description',
+            'status__is_final', 'user__email', 'user__first_name', 'user__last_name',
+            'user__is_active', 'user__profile__updated_at'
+        ).annotate(
+            items_digest=related_digest(
+                OrderItem.objects.filter(order=OuterRef('pk')), 'order',
+                'id', 'product_id', 'product_name', 'product_sku', 'price', 'quantity'
+            ),
+            roles_digest=related_digest(
+                UserRole.objects.filter(user=OuterRef('user')), 'user',
+                'id', 'role_id', 'role__name', 'role__description', 'assigned_at'
+            )
+        )
+    
     def perform_create(self, serializer):
         """Create order from cart."""
         with transaction.atomic():
@@ -75,6 +98,7 @@ class OrderItemViewSet(viewsets.ModelViewSet):
     """ViewSet for OrderItem model."""
     serializer_class = OrderItemSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalKeysetPagination
     
     def get_queryset(self):
         return OrderItem.objects.filter(order__user=self.request.user)
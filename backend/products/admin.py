@@ -1,14 +1,66 @@
 """
 настройка админки для приложения товаров
 """
-from django.contrib import admin
+import io
+from decimal import Decimal
+
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.admin import display
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
+from .importers import IMPORT_FORMATS, ProductImporter, ProductSync, guess_format, read_rows
 from .models import Category, Product, ProductCategory, ProductImage
+from .pricing import MAX_PERCENT, RepricingRule, reprice_products
 from simple_history.admin import SimpleHistoryAdmin
 
 
+class ProductImportForm(forms.Form):
+    # форма загрузки файла потокового импорта товаров
+    file = forms.FileField(label='файл')
+    format = forms.ChoiceField(
+        label='формат',
+        choices=[('', 'по расширению файла')] + [(value, value) for value in IMPORT_FORMATS],
+        required=False
+    )
+    chunk_size = forms.IntegerField(label='размер пачки', min_value=1, max_value=10000, initial=1000)
+    sync = forms.BooleanField(
+        label='синхронизация с полным фидом',
+        help_text='применяются только изменившиеся строки, отсутствующие в файле товары деактивируются',
+        required=False
+    )
+
+
+class RepricingForm(forms.Form):
+    # параметры переоценки выбранных товаров
+    percent = forms.DecimalField(
+        label='изменение, %', max_digits=6, decimal_places=2, max_value=MAX_PERCENT, required=False
+    )
+    amount = forms.DecimalField(label='изменение, ₽', max_digits=10, decimal_places=2, required=False)
+    round_to = forms.DecimalField(
+        label='округлить до окончания',
+        help_text='например 0.90: 104.37 → 103.90, 104.62 → 104.90',
+        max_digits=3,
+        decimal_places=2,
+        min_value=0,
+        max_value=Decimal('0.99'),
+        required=False
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if all(cleaned_data.get(name) is None for name in ('percent', 'amount', 'round_to')):
+            raise forms.ValidationError('укажите изменение цены или округление')
+        if cleaned_data.get('percent') is not None and cleaned_data['percent'] <= -100:
+            raise forms.ValidationError('снижение не может быть 100% и более')
+        return cleaned_data
+
+
 class ProductCategoryInline(admin.TabularInline):
     # inline для отображения связей товар-категория
     model = ProductCategory
@@ -28,7 +80,7 @@ class ProductImageInline(admin.TabularInline):
         if obj.image:
             return format_html(
                 '<img src="{}" style="width: 80px; height: auto;" />',
-                obj.image.url
+                obj.get_variant_url('small')
             )
         return ''
 
@@ -91,6 +143,7 @@ class ProductAdmin(SimpleHistoryAdmin):
     raw_id_fields = ()  # убрали categories из-за связи через ProductCategory
     
     inlines = (ProductImageInline, ProductCategoryInline)  # добавили inline для связей
+    change_list_template = 'admin/products/product/change_list.html'
     
     fieldsets = (
         (None, {
@@ -104,6 +157,8 @@ class ProductAdmin(SimpleHistoryAdmin):
     
     readonly_fields = ('created_at', 'updated_at')
     
+    actions = ['reprice_selected']
+    
     @display(description=_('цена'))
     def get_price_display(self, obj):
         # отображение цены с валютой
@@ -118,6 +173,74 @@ class ProductAdmin(SimpleHistoryAdmin):
     
     def get_queryset(self, request):
         return super().get_queryset(request).prefetch_related('categories', 'images')
+    
+    def get_urls(self):
+        urls = [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_products_view),
+                name='products_product_import'
+            ),
+        ]
+        return urls + super().get_urls()
+    
+    def import_products_view(self, request):
+        # потоковый импорт csv/jsonl: загруженный файл читается построчно
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            import_format = form.cleaned_data['format'] or guess_format(upload.name)
+            importer_class = ProductSync if form.cleaned_data['sync'] else ProductImporter
+            importer = importer_class(chunk_size=form.cleaned_data['chunk_size'], user=request.user)
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                result = importer.run(read_rows(stream, import_format))
+            except ValueError as error:
+                # ошибка формата файла: уже записанные пачки сохраняются
+                self.message_user(request, f'{error}; {importer.result}', messages.ERROR)
+            else:
+                for line, message in result.errors:
+                    self.message_user(request, f'строка {line}: {message}', messages.WARNING)
+                self.message_user(request, f'импорт завершён: {result}', messages.SUCCESS)
+            return redirect('admin:products_product_changelist')
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Импорт товаров',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/products/product/import_products.html', context)
+    
+    @admin.action(description='переоценить выбранные товары', permissions=['change'])
+    def reprice_selected(self, request, queryset):
+        # переоценка через промежуточную форму, запись пачками с историей
+        form = RepricingForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            rule = RepricingRule(**{
+                name: value for name, value in form.cleaned_data.items() if value is not None
+            })
+            try:
+                result = reprice_products([rule], queryset=queryset, user=request.user)
+            except ValueError as error:
+                # правило отклонено до записи цен
+                self.message_user(request, f'переоценка не выполнена: {error}', messages.ERROR)
+            else:
+                self.message_user(request, f'переоценка завершена: {result}', messages.SUCCESS)
+            return None
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Переоценка товаров',
+            'form': form,
+            'selected': list(queryset.values_list('pk', flat=True)),
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/products/product/reprice.html', context)
 
 
 @admin.register(ProductImage)
@@ -145,7 +268,7 @@ class ProductImageAdmin(SimpleHistoryAdmin):
         return format_html('<span style="color: gray;">-</span>')
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('product')
+        return super().get_queryset(request).select_related('product').defer('product__search_vector')
 
 
 @admin.register(ProductCategory)
@@ -173,4 +296,4 @@ class ProductCategoryAdmin(SimpleHistoryAdmin):
         return format_html('<a href="{}">{}</a>', url, obj.category.name)
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('product', 'category')
+        return super().get_queryset(request).select_related('product', 'category').defer('product__search_vector')
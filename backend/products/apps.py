@@ -0,0 +1,15 @@
+"""
+конфигурация приложения товаров
+"""
+from django.apps import AppConfig
+
+
+class ProductsConfig(AppConfig):
+    # конфигурация приложения товаров
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'products'
+    verbose_name = 'товары'
+    
+    def ready(self):
+        # подключение обработчиков сигналов
+        from . import signals  # noqa: F401
@@ -0,0 +1,127 @@
+"""
+кэширование данных каталога
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+from .models import Category
+
+# области версионирования кэша каталога
+CATEGORIES_SCOPE = 'categories'
+PRODUCTS_SCOPE = 'products'
+
+VERSION_KEY_PREFIX = 'products:version:'
+
+
+def product_scope(product_id):
+    # область версионирования отдельного товара
+    return f'product:{product_id}'
+
+
+def get_versions(*scopes):
+    # текущие версии областей кэша одним обращением к кэшу
+    keys = [f'{VERSION_KEY_PREFIX}{scope}' for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # новая версия не должна совпасть с версией до вытеснения ключа
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*scopes):
+    # инвалидация областей кэша сменой версии без перебора ключей
+    for scope in scopes:
+        key = f'{VERSION_KEY_PREFIX}{scope}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def invalidate_products(*product_ids):
+    # инвалидация кэша списков товаров и перечисленных товаров
+    bump_versions(PRODUCTS_SCOPE, *(product_scope(pk) for pk in product_ids))
+
+
+def invalidate_categories():
+    # инвалидация кэша категорий и всех ответов, включающих категории
+    bump_versions(CATEGORIES_SCOPE)
+
+
+def build_category_tree():
+    # построение вложенного дерева активных категорий одним запросом
+    rows = Category.objects.filter(is_active=True).order_by('name').values(
+        'id', 'name', 'parent_id'
+    )
+    nodes = {row['id']: {'id': row['id'], 'name': row['name'], 'children': []} for row in rows}
+    tree = []
+    for row in rows:
+        node = nodes[row['id']]
+        if row['parent_id'] is None:
+            tree.append(node)
+        elif row['parent_id'] in nodes:
+            nodes[row['parent_id']]['children'].append(node)
+        # потомки неактивных категорий в навигацию не попадают
+    return tree
+
+
+def get_category_tree():
+    # дерево категорий из кэша, хранится до изменения любой категории
+    version, = get_versions(CATEGORIES_SCOPE)
+    cache_key = f'products:category-tree:{version}'
+    tree = cache.get(cache_key)
+    if tree is None:
+        tree = build_category_tree()
+        cache.set(cache_key, tree, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return tree
+
+
+class CachedResponseMixin:
+    """
+    Cache list and detail responses under versioned keys.
+
+    The key combines the scheme, host, path, normalized query parameters
+    and the current versions of the scopes returned by `get_cache_scopes`,
+    so a signal bumping a scope version makes every dependent entry
+    unreachable.
+    """
+    cache_timeout = None
+    cache_responses = True
+
+    def get_cache_scopes(self):
+        """Return the version scopes the current response depends on."""
+        raise NotImplementedError
+
+    def get_response_cache_key(self, request):
+        """Build the cache key for the current request."""
+        params = sorted(
+            (key, sorted(request.query_params.getlist(key))) for key in request.query_params
+        )
+        versions = get_versions(*self.get_cache_scopes())
+        raw = repr((request.scheme, request.get_host(), request.path, params, versions))
+        return f'products:response:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        """Return the cached response data or run the handler and cache it."""
+        if not self.cache_responses:
+            return handler(request, *args, **kwargs)
+        cache_key = self.get_response_cache_key(request)
+        data = cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.cache_timeout or settings.CATALOG_CACHE_TIMEOUT
+            cache.set(cache_key, response.data, timeout=timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request, *args, **kwargs)
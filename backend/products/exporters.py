@@ -0,0 +1,137 @@
+"""
+потоковая выгрузка каталога товаров в csv, jsonl и yml
+"""
+import csv
+import json
+from itertools import islice
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.utils import timezone
+from .models import Category, Product, ProductCategory, ProductImage
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'yml')
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'yml': 'application/xml; charset=utf-8',
+}
+EXPORT_COLUMNS = (
+    'id', 'sku', 'name', 'description', 'price', 'is_active', 'categories', 'main_image_url',
+)
+
+
+class Echo:
+    # псевдо-файл для csv.writer: строка возвращается, а не накапливается
+    def write(self, value):
+        return value
+
+
+class CatalogExporter:
+    """
+    Stream products with their categories and main image URL.
+
+    Products are read with a server-side cursor in chunks of `chunk_size`
+    rows; category links are loaded with one query per chunk, so only the
+    current chunk and the category names are ever held in memory.
+    """
+
+    def __init__(self, queryset=None, chunk_size=None, base_url=''):
+        self.queryset = Product.objects.all() if queryset is None else queryset
+        self.chunk_size = chunk_size or settings.PRODUCT_EXPORT_CHUNK_SIZE
+        self.base_url = base_url.rstrip('/')
+        self.storage = ProductImage._meta.get_field('image').storage
+
+    def get_categories(self):
+        # все категории одним запросом: их на порядки меньше, чем товаров
+        if not hasattr(self, '_categories'):
+            self._categories = {
+                row['id']: row
+                for row in Category.objects.order_by('id').values('id', 'name', 'parent_id', 'full_path')
+            }
+        return self._categories
+
+    def iter_rows(self):
+        # словари товаров в порядке первичного ключа
+        rows = self.queryset.prefetch_related(None).order_by('pk').values(
+            'id', 'sku', 'name', 'description', 'price', 'is_active', 'main_image__image'
+        ).iterator(chunk_size=self.chunk_size)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            links = {}
+            for product_id, category_id in ProductCategory.objects.filter(
+                product_id__in=[row['id'] for row in chunk]
+            ).order_by('category_id').values_list('product_id', 'category_id'):
+                links.setdefault(product_id, []).append(category_id)
+            for row in chunk:
+                image = row.pop('main_image__image')
+                row['main_image_url'] = self.get_absolute_url(self.storage.url(image)) if image else ''
+                row['categories'] = links.get(row['id'], [])
+                yield row
+
+    def get_absolute_url(self, url):
+        if url.startswith(('http://', 'https://')):
+            return url
+        return f'{self.base_url}{url}'
+
+    def export(self, export_format):
+        # генератор строк выгрузки в выбранном формате
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f'неизвестный формат выгрузки: {export_format}')
+        return getattr(self, f'export_{export_format}')()
+
+    def export_csv(self):
+        categories = self.get_categories()
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_COLUMNS)
+        for row in self.iter_rows():
+            row['categories'] = '|'.join(
+                categories[pk]['full_path'] for pk in row['categories'] if pk in categories
+            )
+            yield writer.writerow([row[column] for column in EXPORT_COLUMNS])
+
+    def export_jsonl(self):
+        categories = self.get_categories()
+        for row in self.iter_rows():
+            row['price'] = str(row['price'])
+            row['categories'] = [
+                {'id': pk, 'name': categories[pk]['name']}
+                for pk in row['categories'] if pk in categories
+            ]
+            yield json.dumps({column: row[column] for column in EXPORT_COLUMNS}, ensure_ascii=False) + '\n'
+
+    def export_yml(self):
+        # фид маркетплейса в формате YML (Яндекс Маркет)
+        categories = self.get_categories()
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield f'<yml_catalog date={quoteattr(timezone.now().strftime("%Y-%m-%dT%H:%M%z"))}>\n<shop>\n'
+        yield f'<name>{escape(settings.PRODUCT_FEED_SHOP_NAME)}</name>\n'
+        yield f'<company>{escape(settings.PRODUCT_FEED_COMPANY)}</company>\n'
+        yield f'<url>{escape(self.base_url or "/")}</url>\n'
+        yield '<currencies><currency id="RUR" rate="1"/></currencies>\n<categories>\n'
+        for category in categories.values():
+            parent = (
+                f' parentId="{category["parent_id"]}"'
+                if category['parent_id'] in categories else ''
+            )
+            yield f'<category id="{category["id"]}"{parent}>{escape(category["name"])}</category>\n'
+        yield '</categories>\n<offers>\n'
+        for row in self.iter_rows():
+            offer = [
+                f'<offer id={quoteattr(row["sku"])} available="{str(row["is_active"]).lower()}">',
+                f'<name>{escape(row["name"])}</name>',
+                f'<vendorCode>{escape(row["sku"])}</vendorCode>',
+                f'<price>{row["price"]}</price>',
+                '<currencyId>RUR</currencyId>',
+            ]
+            if row['categories']:
+                offer.append(f'<categoryId>{row["categories"][0]}</categoryId>')
+            if row['main_image_url']:
+                offer.append(f'<picture>{escape(row["main_image_url"])}</picture>')
+            if row['description']:
+                offer.append(f'<description>{escape(row["description"])}</description>')
+            offer.append('</offer>\n')
+            yield ''.join(offer)
+        yield '</offers>\n</shop>\n</yml_catalog>\n'
@@ -0,0 +1,93 @@
+"""
+фасеты для списка товаров: количество по категориям и гистограмма цен
+"""
+import hashlib
+from decimal import ROUND_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, IntegerField, Max, Min, Value
+from django.db.models.functions import Floor, Least
+from .cache import CATEGORIES_SCOPE, PRODUCTS_SCOPE, get_versions
+from .models import ProductCategory
+
+PRICE_BUCKETS = 10
+
+# параметры, не влияющие на набор отфильтрованных товаров
+IGNORED_QUERY_PARAMS = {
+    'page', 'page_size', 'cursor', 'pagination', 'ordering', 'facets', 'format', 'fields', 'expand',
+}
+
+
+def get_filter_signature(query_params):
+    # нормализованная подпись набора фильтров для ключа кэша
+    items = sorted(
+        (key, sorted(query_params.getlist(key)))
+        for key in query_params
+        if key not in IGNORED_QUERY_PARAMS
+    )
+    return hashlib.md5(repr(items).encode()).hexdigest()
+
+
+def get_category_facets(queryset):
+    # количество товаров по категориям одним агрегирующим запросом
+    rows = (
+        ProductCategory.objects.filter(product__in=queryset.values('pk'))
+        .values('category_id', 'category__name')
+        .annotate(count=Count('product_id', distinct=True))
+        .order_by('-count', 'category__name')
+    )
+    return [
+        {'id': row['category_id'], 'name': row['category__name'], 'count': row['count']}
+        for row in rows
+    ]
+
+
+def get_price_facets(queryset, buckets=PRICE_BUCKETS):
+    # гистограмма цен с равными интервалами: границы и распределение по корзинам
+    bounds = queryset.aggregate(min_price=Min('price'), max_price=Max('price'))
+    min_price, max_price = bounds['min_price'], bounds['max_price']
+    if min_price is None:
+        return []
+    if min_price == max_price:
+        return [{'min': str(min_price), 'max': str(max_price), 'count': queryset.count()}]
+    
+    width = ((max_price - min_price) / buckets).quantize(Decimal('0.01'), rounding=ROUND_UP)
+    bucket = Least(
+        Floor(ExpressionWrapper(
+            (F('price') - Value(min_price)) / Value(width),
+            output_field=DecimalField()
+        )),
+        Value(buckets - 1),
+        output_field=IntegerField()
+    )
+    counts = dict(
+        queryset.annotate(bucket=bucket)
+        .values('bucket')
+        .annotate(count=Count('pk'))
+        .values_list('bucket', 'count')
+    )
+    return [
+        {
+            'min': str(min_price + width * index),
+            'max': str(min(min_price + width * (index + 1), max_price)),
+            'count': counts.get(index, 0),
+        }
+        for index in range(buckets)
+    ]
+
+
+def get_facets(query_params, get_queryset):
+    # фасеты для текущего набора фильтров с кэшем по подписи фильтров
+    # get_queryset вызывается только при промахе кэша
+    versions = get_versions(PRODUCTS_SCOPE, CATEGORIES_SCOPE)
+    cache_key = 'products:facets:{}:{}.{}'.format(get_filter_signature(query_params), *versions)
+    facets = cache.get(cache_key)
+    if facets is None:
+        queryset = get_queryset().order_by().select_related(None).prefetch_related(None)
+        facets = {
+            'categories': get_category_facets(queryset),
+            'price': get_price_facets(queryset),
+        }
+        cache.set(cache_key, facets, timeout=settings.PRODUCT_FACETS_CACHE_TIMEOUT)
+    return facets
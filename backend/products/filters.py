@@ -0,0 +1,70 @@
+"""
+Filters for products app.
+"""
+import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Exists, F, OuterRef, Q
+from rest_framework import filters
+from .models import Category, Product, ProductCategory
+
+
+class ProductFilter(django_filters.FilterSet):
+    """Filter set for Product model."""
+    category = django_filters.NumberFilter(method='filter_category_tree')
+    
+    class Meta:
+        model = Product
+        fields = {
+            'price': ['gte', 'lte'],
+            'categories': ['exact'],
+            'is_active': ['exact'],
+        }
+    
+    def filter_category_tree(self, queryset, name, value):
+        """Filter products linked to the category or any of its descendants."""
+        path = Category.objects.filter(pk=value).values_list('path', flat=True).first()
+        if path is None:
+            return queryset.none()
+        # the constant path prefix lets the LIKE 'prefix%' use the path index
+        return queryset.filter(
+            Exists(ProductCategory.objects.filter(
+                product=OuterRef('pk'),
+                category__path__startswith=path
+            ))
+        )
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Full-text product search over the maintained search_vector column.
+    
+    An exact SKU match takes the unique B-tree index fast path; otherwise
+    results are matched against the GIN index, or by a case-insensitive
+    SKU prefix, and ranked by relevance unless the client asked for an
+    explicit ordering.
+    """
+    search_config = 'russian'
+    
+    def get_search_text(self, request):
+        """Get the raw search string from the query parameters."""
+        return request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+    
+    def filter_queryset(self, request, queryset, view):
+        search_text = self.get_search_text(request)
+        if not search_text:
+            return queryset
+        
+        if len(search_text.split()) == 1:
+            sku_match = queryset.filter(sku=search_text)
+            if sku_match.exists():
+                return sku_match
+        
+        # артикул ищется и по началу без учёта регистра: префиксный индекс по UPPER(sku)
+        query = SearchQuery(search_text, config=self.search_config, search_type='websearch')
+        queryset = queryset.filter(Q(search_vector=query) | Q(sku__istartswith=search_text)).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+        ordering_param = getattr(view, 'ordering_param', filters.OrderingFilter.ordering_param)
+        if not request.query_params.get(ordering_param):
+            queryset = queryset.order_by('-search_rank', *queryset.query.order_by)
+        return queryset
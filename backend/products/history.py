@@ -0,0 +1,67 @@
+"""
+временной ряд цен товара по записям simple_history
+"""
+from django.db.models import F, Q, Window
+from django.db.models.functions import Lag
+from .models import Product
+
+MAX_POINTS = 1000
+DEFAULT_POINTS = 200
+
+
+def downsample(points, since, until, limit):
+    # ступенчатый ряд: в каждом из limit интервалов остаётся последняя цена,
+    # действовавшая в конце интервала, а первая точка ряда сохраняется
+    if len(points) <= limit:
+        return points
+    start = since or points[0][0]
+    end = until or points[-1][0]
+    # первая точка занимает одно место из limit
+    width = (end - start) / (limit - 1)
+    if not width:
+        return [points[0], points[-1]]
+    sampled = [points[0]]
+    buckets = {}
+    for point in points[1:]:
+        bucket = min(int((point[0] - start) / width), limit - 2)
+        buckets[bucket] = point
+    for bucket in sorted(buckets):
+        if buckets[bucket][1] != sampled[-1][1]:
+            sampled.append(buckets[bucket])
+    return sampled
+
+
+def get_price_history(product_id, since=None, until=None, points=DEFAULT_POINTS):
+    """
+    Return the product's price changes as a list of (timestamp, price).
+
+    Revisions that did not change the price are dropped in SQL with a LAG
+    window over the (id, history_date) index, so only the change points
+    leave the database. When `since` is given the series starts with the
+    price in effect at that moment. Series longer than `points` are
+    downsampled to the last price of equal time intervals.
+    """
+    revisions = Product.history.filter(id=product_id).exclude(history_type='-')
+    if until is not None:
+        revisions = revisions.filter(history_date__lte=until)
+
+    series = []
+    if since is not None:
+        previous = revisions.filter(history_date__lt=since).order_by(
+            '-history_date', '-history_id'
+        ).values_list('price', flat=True).first()
+        if previous is not None:
+            series.append((since, previous))
+        revisions = revisions.filter(history_date__gte=since)
+
+    changes = revisions.annotate(
+        previous_price=Window(Lag('price'), order_by=[F('history_date').asc(), F('history_id').asc()])
+    ).filter(
+        Q(previous_price__isnull=True) | ~Q(price=F('previous_price'))
+    ).order_by('history_date', 'history_id').values_list('history_date', 'price')
+
+    for point in changes:
+        # первая ревизия диапазона может повторять цену на его начало
+        if not series or point[1] != series[-1][1]:
+            series.append(point)
+    return downsample(series, since, until, points)
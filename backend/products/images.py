@@ -0,0 +1,110 @@
+"""
+фоновая генерация производных изображений товаров
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+from .cache import invalidate_products
+from .models import Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'products/derivatives'
+
+_executor = None
+
+
+def get_executor():
+    # общий пул потоков процесса, создаётся при первой загрузке изображения
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PRODUCT_IMAGE_WORKERS,
+            thread_name_prefix='product-images'
+        )
+    return _executor
+
+
+def derivative_urls(derivatives):
+    # карта «вариант: url» по сохранённым путям, от меньшего размера к большему
+    storage = ProductImage._meta.get_field('image').storage
+    variants = (derivatives or {}).get('variants', {})
+    return {
+        name: storage.url(variants[name])
+        for name in settings.PRODUCT_IMAGE_SIZES
+        if name in variants
+    }
+
+
+def render_derivative(original, size):
+    # уменьшенная копия в webp, исходник меньше размера не увеличивается
+    image = original.copy()
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=settings.PRODUCT_IMAGE_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def build_derivatives(image_id):
+    """
+    Generate the configured WebP variants of a product image.
+
+    Files are named after the SHA-256 of the original content, so the same
+    upload attached twice reuses the stored variants. The map is only saved
+    if the image file was not replaced while it was being processed.
+    """
+    product_image = ProductImage.objects.filter(pk=image_id).only('id', 'product_id', 'image').first()
+    if product_image is None or not product_image.image:
+        return None
+
+    source = product_image.image.name
+    storage = product_image.image.storage
+    with storage.open(source, 'rb') as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()
+
+    variants = {}
+    original = None
+    for name, size in settings.PRODUCT_IMAGE_SIZES.items():
+        path = f'{DERIVATIVES_DIR}/{digest[:2]}/{digest}-{size}.webp'
+        if not storage.exists(path):
+            if original is None:
+                original = ImageOps.exif_transpose(Image.open(BytesIO(content)))
+                if original.mode not in ('RGB', 'RGBA'):
+                    original = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+            path = storage.save(path, ContentFile(render_derivative(original, size)))
+        variants[name] = path
+
+    derivatives = {'source': source, 'variants': variants}
+    updated = ProductImage.objects.filter(pk=image_id, image=source).update(derivatives=derivatives)
+    if updated:
+        # update() не отправляет сигналы, поэтому дата изменения и кэш товара
+        # обновляются явно
+        Product.objects.filter(pk=product_image.product_id).touch()
+        invalidate_products(product_image.product_id)
+    return derivatives
+
+
+def run_build_derivatives(image_id):
+    # задача пула: у каждого потока своё соединение с базой
+    close_old_connections()
+    try:
+        build_derivatives(image_id)
+    except Exception:
+        logger.exception('не удалось построить производные изображения %s', image_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(image_id):
+    # запуск после коммита, чтобы поток увидел сохранённую запись и файл
+    if settings.PRODUCT_IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(run_build_derivatives, image_id))
+    else:
+        transaction.on_commit(lambda: run_build_derivatives(image_id))
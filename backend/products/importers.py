@@ -0,0 +1,385 @@
+"""
+потоковый импорт каталога товаров из csv и jsonl
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+from .cache import invalidate_products
+from .models import Category, Product, ProductCategory
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+IMPORT_FIELDS = ('name', 'description', 'price', 'is_active')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'нет'}
+MAX_REPORTED_ERRORS = 100
+
+
+def read_csv_rows(stream):
+    # построчное чтение csv: заголовок задаёт имена колонок
+    # ошибка разбора (NUL-байт, незакрытые кавычки) сообщается как ошибка формата
+    reader = csv.DictReader(stream, strict=True)
+    try:
+        yield from reader
+    except csv.Error as error:
+        raise ValueError(f'некорректный csv после строки файла {reader.line_num}: {error}') from error
+
+
+def read_jsonl_rows(stream):
+    # построчное чтение jsonl: один объект товара на строку
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_rows(stream, import_format):
+    # выбор читателя строк по формату файла
+    if import_format == 'csv':
+        return read_csv_rows(stream)
+    if import_format == 'jsonl':
+        return read_jsonl_rows(stream)
+    raise ValueError(f'неизвестный формат импорта: {import_format}')
+
+
+def guess_format(filename):
+    # определение формата по расширению файла
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+def check_max_length(field_name, value):
+    # строка длиннее поля модели отклоняется до записи, а не ошибкой базы посреди импорта
+    field = Product._meta.get_field(field_name)
+    if len(value) > field.max_length:
+        raise ValueError(f'{field.verbose_name}: длина больше {field.max_length} символов')
+
+
+def chunked(iterable, size):
+    # разбиение потока на списки фиксированного размера
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ImportResult:
+    # итоги импорта: счётчики и первые ошибки по строкам
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def __str__(self):
+        return (
+            f'создано: {self.created}, обновлено: {self.updated}, '
+            f'без изменений: {self.unchanged}, ошибок: {self.error_count}'
+        )
+
+
+class ProductImporter:
+    # импорт товаров по артикулу пачками bulk_create/bulk_update
+    # в памяти хранится только текущая пачка строк
+
+    def __init__(self, chunk_size=1000, user=None):
+        self.chunk_size = chunk_size
+        self.user = user
+        self.result = ImportResult()
+
+    def run(self, rows):
+        # импорт потока строк, каждая пачка в отдельной транзакции
+        numbered = enumerate(rows, start=1)
+        for chunk in chunked(numbered, self.chunk_size):
+            self.import_chunk(chunk)
+        return self.result
+
+    def clean_row(self, row):
+        # приведение строки к значениям полей товара
+        # в результат попадают только переданные колонки
+        if any(isinstance(value, str) and '\x00' in value for value in row.values()):
+            # текстовые поля PostgreSQL не принимают NUL-байты
+            raise ValueError('строка содержит NUL-байт')
+        sku = str(row.get('sku') or '').strip()
+        if not sku:
+            raise ValueError('не указан артикул')
+        check_max_length('sku', sku)
+        values = {}
+        if 'name' in row:
+            values['name'] = str(row['name'] or '').strip()
+            if not values['name']:
+                raise ValueError('пустое название')
+            check_max_length('name', values['name'])
+        if 'description' in row:
+            values['description'] = str(row['description'] or '')
+        if 'price' in row:
+            try:
+                values['price'] = Decimal(str(row['price']).strip()).quantize(Decimal('0.01'))
+            except (InvalidOperation, ValueError):
+                raise ValueError(f'некорректная цена: {row["price"]}')
+            if not values['price'].is_finite() or values['price'] < 0:
+                raise ValueError(f'некорректная цена: {row["price"]}')
+            # цена должна помещаться в DecimalField товара
+            price_field = Product._meta.get_field('price')
+            if values['price'].adjusted() >= price_field.max_digits - price_field.decimal_places:
+                raise ValueError(f'слишком большая цена: {row["price"]}')
+        if 'is_active' in row and row['is_active'] not in (None, ''):
+            value = row['is_active']
+            if not isinstance(value, bool):
+                value = str(value).strip().lower()
+                if value not in TRUE_VALUES | FALSE_VALUES:
+                    raise ValueError(f'некорректный признак активности: {row["is_active"]}')
+                value = value in TRUE_VALUES
+            values['is_active'] = value
+
+        categories = row.get('categories')
+        if isinstance(categories, str):
+            categories = [part for part in categories.replace(',', '|').split('|') if part.strip()]
+        try:
+            category_ids = {int(category_id) for category_id in categories or ()}
+        except (TypeError, ValueError):
+            raise ValueError(f'некорректные категории: {row["categories"]}')
+        return sku, values, category_ids
+
+    def clean_chunk(self, chunk):
+        # разбор строк пачки с учётом повторов артикула
+        cleaned = {}
+        for line, row in chunk:
+            try:
+                sku, values, category_ids = self.clean_row(row)
+            except (ValueError, AttributeError) as error:
+                self.result.add_error(line, str(error))
+                continue
+            # повтор артикула внутри пачки: последняя строка дополняет предыдущие
+            previous = cleaned.get(sku, (line, {}, set()))
+            cleaned[sku] = (line, {**previous[1], **values}, previous[2] | category_ids)
+
+        # неизвестные категории отбрасываются одним запросом на пачку
+        known_categories = set(Category.objects.filter(
+            pk__in={pk for _, _, category_ids in cleaned.values() for pk in category_ids}
+        ).values_list('pk', flat=True))
+        for line, _, category_ids in cleaned.values():
+            unknown = category_ids - known_categories
+            if unknown:
+                self.result.add_error(line, f'неизвестные категории: {sorted(unknown)}')
+                category_ids -= unknown
+        return cleaned
+
+    def import_chunk(self, chunk):
+        # импорт одной пачки: один запрос на поиск существующих товаров по артикулу
+        cleaned = self.clean_chunk(chunk)
+        if not cleaned:
+            return
+
+        existing = Product.objects.in_bulk(list(cleaned), field_name='sku')
+        now = timezone.now()
+        to_create, to_update, links = [], [], []
+        for sku, (line, values, category_ids) in cleaned.items():
+            product = existing.get(sku)
+            if product is None:
+                if 'name' not in values or 'price' not in values:
+                    self.result.add_error(line, 'для нового товара нужны название и цена')
+                    continue
+                product = Product(sku=sku, **values)
+                to_create.append(product)
+            elif any(getattr(product, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(product, field, value)
+                product.updated_at = now
+                to_update.append(product)
+            else:
+                self.result.unchanged += 1
+            links.extend((product, category_id) for category_id in category_ids)
+
+        self.write_chunk(to_create, to_update, links)
+        self.result.created += len(to_create)
+        self.result.updated += len(to_update)
+
+    def write_chunk(self, to_create, to_update, links, stale_links=None):
+        # запись пачки: история создаётся пачкой вместе с товарами
+        # stale_links: {id товара: id категорий} — связи, удаляемые перед записью новых
+        with transaction.atomic():
+            if to_create:
+                bulk_create_with_history(
+                    to_create, Product, batch_size=self.chunk_size, default_user=self.user
+                )
+            if to_update:
+                bulk_update_with_history(
+                    to_update, Product, [*IMPORT_FIELDS, 'updated_at'],
+                    batch_size=self.chunk_size, default_user=self.user
+                )
+            if stale_links:
+                ProductCategory.objects.filter(reduce(or_, (
+                    Q(product_id=product_id, category_id__in=category_ids)
+                    for product_id, category_ids in stale_links.items()
+                ))).delete()
+            if links:
+                ProductCategory.objects.bulk_create(
+                    [
+                        ProductCategory(product_id=product.pk, category_id=category_id)
+                        for product, category_id in links
+                        if product.pk
+                    ],
+                    batch_size=self.chunk_size,
+                    ignore_conflicts=True
+                )
+
+            # bulk-операции не вызывают save(), а отпечаток зависит и от категорий,
+            # поэтому он пересчитывается после записи связей
+            changed = {product.pk for product in to_create + to_update}
+            changed.update(product.pk for product, _ in links)
+            if changed:
+                Product.objects.filter(pk__in=changed).refresh_content_hashes()
+
+        # bulk-операции не отправляют сигналы, поэтому кэш сбрасывается явно
+        if changed:
+            invalidate_products(*changed)
+
+
+class SyncResult(ImportResult):
+    # итоги синхронизации: счётчики и артикулы изменённых товаров
+
+    def __init__(self):
+        super().__init__()
+        self.deactivated = 0
+        self.diff = {'created': [], 'updated': [], 'deactivated': []}
+
+    def add_diff(self, kind, skus):
+        reported = self.diff[kind]
+        reported.extend(skus[:MAX_REPORTED_ERRORS - len(reported)])
+
+    def __str__(self):
+        return f'{super().__str__()}, деактивировано: {self.deactivated}'
+
+
+class ProductSync(ProductImporter):
+    # синхронизация каталога с полным фидом поставщика по отпечаткам строк
+    # неизменённые строки не приводят к записи, обновлению updated_at и истории
+    # артикулы фида держатся в памяти для деактивации отсутствующих товаров
+
+    def __init__(self, chunk_size=1000, user=None, deactivate_missing=True, dry_run=False):
+        super().__init__(chunk_size=chunk_size, user=user)
+        self.result = SyncResult()
+        self.deactivate_missing = deactivate_missing
+        self.dry_run = dry_run
+        self.seen_skus = set()
+
+    def run(self, rows):
+        super().run(rows)
+        # деактивация выполняется только после успешного чтения всего фида
+        if self.deactivate_missing:
+            self.deactivate_missing_products()
+        return self.result
+
+    def clean_row(self, row):
+        # строка фида описывает товар целиком
+        sku, values, category_ids = super().clean_row(row)
+        if 'name' not in values or 'price' not in values:
+            raise ValueError('в строке фида нужны название и цена')
+        values.setdefault('description', '')
+        values.setdefault('is_active', True)
+        return sku, values, category_ids
+
+    def import_chunk(self, chunk):
+        # сравнение пачки с сохранёнными отпечатками одним запросом
+        # артикулы строк с ошибками тоже считаются присутствующими в фиде
+        self.seen_skus.update(
+            str(row.get('sku') or '').strip() for _, row in chunk if isinstance(row, dict)
+        )
+        cleaned = self.clean_chunk(chunk)
+        if not cleaned:
+            return
+
+        stored = dict(
+            Product.objects.filter(sku__in=list(cleaned)).values_list('sku', 'content_hash')
+        )
+        hashes = {
+            sku: Product.build_content_hash(
+                *(values[field] for field in Product.CONTENT_HASH_FIELDS), category_ids
+            )
+            for sku, (_, values, category_ids) in cleaned.items()
+        }
+        # полные объекты и категории загружаются только для изменившихся товаров
+        existing = Product.objects.in_bulk(
+            [sku for sku, content_hash in stored.items() if content_hash != hashes[sku]],
+            field_name='sku'
+        )
+        stored_categories = Product.get_category_ids(
+            [product.pk for product in existing.values()]
+        )
+
+        now = timezone.now()
+        to_create, to_update, to_rehash, links = [], [], [], []
+        stale_links = {}
+        for sku, (line, values, category_ids) in cleaned.items():
+            if sku not in stored:
+                product = Product(sku=sku, **values)
+                to_create.append(product)
+            elif sku not in existing:
+                self.result.unchanged += 1
+                continue
+            else:
+                product = existing[sku]
+                current_categories = set(stored_categories[product.pk])
+                if current_categories == category_ids and all(
+                    getattr(product, field) == value for field, value in values.items()
+                ):
+                    # отпечаток не был посчитан, например для товаров до его появления
+                    product.content_hash = hashes[sku]
+                    to_rehash.append(product)
+                    self.result.unchanged += 1
+                    continue
+                for field, value in values.items():
+                    setattr(product, field, value)
+                product.updated_at = now
+                to_update.append(product)
+                # фид задаёт категории товара целиком: лишние связи удаляются
+                if current_categories - category_ids:
+                    stale_links[product.pk] = current_categories - category_ids
+                category_ids = category_ids - current_categories
+            links.extend((product, category_id) for category_id in category_ids)
+
+        if not self.dry_run:
+            self.write_chunk(to_create, to_update, links, stale_links)
+            if to_rehash:
+                Product.objects.bulk_update(to_rehash, ['content_hash'], batch_size=self.chunk_size)
+        self.result.created += len(to_create)
+        self.result.updated += len(to_update)
+        self.result.add_diff('created', [product.sku for product in to_create])
+        self.result.add_diff('updated', [product.sku for product in to_update])
+
+    def deactivate_missing_products(self):
+        # деактивация активных товаров, отсутствующих в фиде, пачками по первичному ключу
+        missing = [
+            pk for pk, sku in Product.objects.filter(is_active=True)
+            .values_list('pk', 'sku').iterator(chunk_size=self.chunk_size)
+            if sku not in self.seen_skus
+        ]
+        now = timezone.now()
+        for ids in chunked(missing, self.chunk_size):
+            products = list(Product.objects.filter(pk__in=ids, is_active=True))
+            for product in products:
+                product.is_active = False
+                product.updated_at = now
+            if not self.dry_run:
+                self.write_chunk([], products, [])
+            self.result.deactivated += len(products)
+            self.result.add_diff('deactivated', [product.sku for product in products])
@@ -0,0 +1,36 @@
+"""
+заполнение ссылки на основное изображение для существующих товаров
+"""
+from django.core.management.base import BaseCommand
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'заполняет Product.main_image для существующего каталога'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='количество товаров, обновляемых одним запросом'
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        updated = 0
+        last_id = 0
+        
+        # обход по диапазонам первичного ключа, чтобы не держать длинные блокировки
+        while True:
+            ids = list(
+                Product.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            updated += Product.objects.filter(pk__in=ids).refresh_main_images()
+            last_id = ids[-1]
+        
+        self.stdout.write(self.style.SUCCESS(f'обновлено товаров: {updated}'))
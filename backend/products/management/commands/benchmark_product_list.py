@@ -0,0 +1,91 @@
+"""
+сравнение производительности списка товаров: ProductSerializer и values()-путь
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+from products.models import Category, Product, ProductCategory
+from products.views import ProductViewSet
+
+
+class RollbackSeed(Exception):
+    # отмена транзакции с временными тестовыми данными
+    pass
+
+
+class Command(BaseCommand):
+    help = 'измеряет пропускную способность ProductViewSet.list для обоих путей сериализации'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='количество запросов на режим')
+        parser.add_argument('--page-size', type=int, default=100, help='размер страницы')
+        parser.add_argument('--query', default='', help='строка запроса, например "fields=id,name"')
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='создать N временных товаров (откатываются после замера)'
+        )
+    
+    def handle(self, *args, **options):
+        if options['seed']:
+            try:
+                with transaction.atomic():
+                    self.seed(options['seed'])
+                    self.run(options)
+                    raise RollbackSeed
+            except RollbackSeed:
+                pass
+        else:
+            self.run(options)
+    
+    def seed(self, count):
+        # временный каталог: товары с двумя категориями каждый
+        parent = Category.objects.create(name='benchmark')
+        child = Category.objects.create(name='benchmark child', parent=parent)
+        products = Product.objects.bulk_create(
+            Product(name=f'benchmark {i}', description='benchmark', price=i % 1000, sku=f'BENCH-{i}')
+            for i in range(count)
+        )
+        ProductCategory.objects.bulk_create(
+            ProductCategory(product=product, category=category)
+            for product in products
+            for category in (parent, child)
+        )
+    
+    def run(self, options):
+        factory = APIRequestFactory()
+        path = f'/api/v1/products/?{options["query"]}'
+        iterations = options['iterations']
+        
+        results = {}
+        for label, use_values_list in (('ProductSerializer', False), ('values() path', True)):
+            view = ProductViewSet.as_view(
+                {'get': 'list'},
+                cache_responses=False,
+                use_values_list=use_values_list,
+                pagination_class=type(
+                    'BenchmarkPagination',
+                    (ProductViewSet.pagination_class,),
+                    {'page_size': options['page_size']}
+                ),
+            )
+            content = None
+            started = time.perf_counter()
+            for _ in range(iterations):
+                response = view(factory.get(path))
+                response.render()
+                content = response.content
+            elapsed = time.perf_counter() - started
+            results[label] = (elapsed, content)
+            self.stdout.write(
+                f'{label:>18}: {elapsed / iterations * 1000:8.2f} мс/запрос, '
+                f'{iterations / elapsed:8.1f} запросов/с'
+            )
+        
+        (slow, slow_content), (fast, fast_content) = results.values()
+        if slow_content != fast_content:
+            raise CommandError('ответы двух путей сериализации различаются')
+        self.stdout.write(self.style.SUCCESS(f'ответы совпадают побайтно, ускорение x{slow / fast:.2f}'))
@@ -0,0 +1,34 @@
+"""
+генерация производных для уже загруженных изображений товаров
+"""
+from django.core.management.base import BaseCommand
+from products.images import build_derivatives
+from products.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'строит webp-копии изображений товаров заданных в настройках размеров'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='перестроить производные и для изображений, у которых они уже есть'
+        )
+    
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image='').only('id', 'image', 'derivatives')
+        built = failed = 0
+        
+        for image in images.iterator(chunk_size=500):
+            if image.has_current_derivatives() and not options['force']:
+                continue
+            try:
+                build_derivatives(image.pk)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'изображение {image.pk}: {error}')
+            else:
+                built += 1
+        
+        self.stdout.write(self.style.SUCCESS(f'обработано изображений: {built}, ошибок: {failed}'))
@@ -0,0 +1,36 @@
+"""
+пересчёт товаров, которые покупают вместе
+"""
+from django.core.management.base import BaseCommand
+from products.related import build_related_products
+
+
+class Command(BaseCommand):
+    help = 'добавляет новые заказы к счётчикам совместных покупок и обновляет топ связанных товаров'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='пересчитать счётчики по всем заказам (нужно и после смены --top)'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=None,
+            help='число связанных товаров на товар (по умолчанию RELATED_PRODUCTS_LIMIT)'
+        )
+        parser.add_argument(
+            '--settle-seconds',
+            type=int,
+            default=None,
+            help='учитывать только заказы старше заданного числа секунд'
+        )
+    
+    def handle(self, *args, **options):
+        result = build_related_products(
+            full=options['full'],
+            limit=options['top'],
+            settle_seconds=options['settle_seconds']
+        )
+        self.stdout.write(self.style.SUCCESS(str(result)))
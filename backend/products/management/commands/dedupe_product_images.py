@@ -0,0 +1,97 @@
+"""
+дедупликация уже загруженных изображений товаров по содержимому
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from products.cache import invalidate_products
+from products.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = 'считает хэши изображений товаров и переводит копии на один файл'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='только показать найденные копии, ничего не меняя'
+        )
+        parser.add_argument(
+            '--keep-files',
+            action='store_true',
+            help='не удалять файлы, на которые больше не ссылается ни одно изображение'
+        )
+    
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = ProductImage._meta.get_field('image').storage
+        
+        # хэши для изображений, загруженных до появления поля
+        hashed = 0
+        missing = ProductImage.objects.filter(content_hash='').exclude(image='').only('id', 'image')
+        for product_image in missing.iterator(chunk_size=500):
+            try:
+                content_hash = ProductImage.hash_file(product_image.image)
+            except OSError as error:
+                self.stderr.write(f'изображение {product_image.pk}: {error}')
+                continue
+            finally:
+                product_image.image.close()
+            hashed += 1
+            if not dry_run:
+                ProductImage.objects.filter(pk=product_image.pk).update(content_hash=content_hash)
+        
+        # группы одинакового содержимого, сохранённого в разных файлах
+        duplicated_hashes = ProductImage.objects.exclude(content_hash='').values(
+            'content_hash'
+        ).annotate(files=Count('image', distinct=True)).filter(files__gt=1).values_list(
+            'content_hash', flat=True
+        )
+        relinked = removed = reclaimed = 0
+        for content_hash in duplicated_hashes.iterator():
+            rows = list(
+                ProductImage.objects.filter(content_hash=content_hash).order_by('pk').values(
+                    'pk', 'product_id', 'image', 'derivatives'
+                )
+            )
+            canonical = rows[0]['image']
+            duplicates = [row for row in rows if row['image'] != canonical]
+            relinked += len(duplicates)
+            if dry_run:
+                self.stdout.write(
+                    f'{canonical}: копии {", ".join(sorted({row["image"] for row in duplicates}))}'
+                )
+                continue
+            
+            # производные адресуются хэшем содержимого и общие для всех копий
+            ProductImage.objects.bulk_update(
+                [
+                    ProductImage(
+                        pk=row['pk'],
+                        image=canonical,
+                        derivatives={
+                            'source': canonical,
+                            'variants': row['derivatives']['variants'],
+                        } if row['derivatives'].get('variants') else {}
+                    )
+                    for row in duplicates
+                ],
+                ['image', 'derivatives']
+            )
+            product_ids = {row['product_id'] for row in duplicates}
+            Product.objects.filter(pk__in=product_ids).touch()
+            invalidate_products(*product_ids)
+            
+            if options['keep_files']:
+                continue
+            for name in {row['image'] for row in duplicates}:
+                if ProductImage.objects.filter(image=name).exists() or not storage.exists(name):
+                    continue
+                reclaimed += storage.size(name)
+                storage.delete(name)
+                removed += 1
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'посчитано хэшей: {hashed}, переведено на общий файл: {relinked}, '
+            f'удалено файлов: {removed}, освобождено байт: {reclaimed}'
+        ))
@@ -0,0 +1,56 @@
+"""
+потоковая выгрузка каталога товаров в файл
+"""
+from django.core.management.base import BaseCommand
+from products.exporters import EXPORT_FORMATS, CatalogExporter
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'выгружает товары с категориями и основным изображением в csv, jsonl или yml'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file-format',
+            choices=EXPORT_FORMATS,
+            default='csv',
+            help='формат выгрузки'
+        )
+        parser.add_argument(
+            '--output',
+            help='путь к файлу, по умолчанию стандартный вывод'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='количество товаров, читаемых из базы за один раз'
+        )
+        parser.add_argument(
+            '--base-url',
+            default='',
+            help='адрес сайта для абсолютных ссылок на изображения, например https://shop.example'
+        )
+        parser.add_argument(
+            '--active-only',
+            action='store_true',
+            help='выгружать только активные товары'
+        )
+    
+    def handle(self, *args, **options):
+        queryset = Product.objects.all()
+        if options['active_only']:
+            queryset = queryset.filter(is_active=True)
+        exporter = CatalogExporter(
+            queryset=queryset,
+            chunk_size=options['chunk_size'],
+            base_url=options['base_url']
+        )
+        
+        # строки пишутся по мере чтения, файл целиком в памяти не собирается
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(exporter.export(options['file_format']))
+            self.stderr.write(self.style.SUCCESS(f'выгрузка записана в {options["output"]}'))
+        else:
+            for chunk in exporter.export(options['file_format']):
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,67 @@
+"""
+потоковый импорт товаров из csv или jsonl файла
+"""
+from django.core.management.base import BaseCommand, CommandError
+from products.importers import (
+    IMPORT_FORMATS, ProductImporter, ProductSync, guess_format, read_rows
+)
+
+
+class Command(BaseCommand):
+    help = 'импортирует товары из csv или jsonl, сопоставляя строки по артикулу'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='путь к файлу импорта')
+        parser.add_argument(
+            '--format',
+            choices=IMPORT_FORMATS,
+            help='формат файла, по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='количество строк, записываемых одной пачкой'
+        )
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='синхронизация с полным фидом: применяются только изменившиеся строки'
+        )
+        parser.add_argument(
+            '--keep-missing',
+            action='store_true',
+            help='при синхронизации не деактивировать товары, отсутствующие в фиде'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='при синхронизации только вывести изменения, ничего не записывая'
+        )
+    
+    def handle(self, *args, **options):
+        import_format = options['format'] or guess_format(options['path'])
+        if options['sync']:
+            importer = ProductSync(
+                chunk_size=options['chunk_size'],
+                deactivate_missing=not options['keep_missing'],
+                dry_run=options['dry_run']
+            )
+        elif options['dry_run'] or options['keep_missing']:
+            raise CommandError('--dry-run и --keep-missing используются только с --sync')
+        else:
+            importer = ProductImporter(chunk_size=options['chunk_size'])
+        
+        try:
+            # файл читается построчно, в памяти держится только текущая пачка
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                result = importer.run(read_rows(stream, import_format))
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+        
+        for line, message in result.errors:
+            self.stderr.write(f'строка {line}: {message}')
+        for kind, skus in getattr(result, 'diff', {}).items():
+            if skus:
+                self.stdout.write(f'{kind}: {", ".join(skus)}')
+        self.stdout.write(self.style.SUCCESS(str(result)))
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:27
+
+from django.db import migrations, models
+
+
+def build_category_paths(apps, schema_editor):
+    # заполнение материализованных путей обходом дерева в ширину
+    Category = apps.get_model('products', 'Category')
+    categories = list(Category.objects.only('id', 'name', 'parent_id'))
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_id, []).append(category)
+    
+    queue = [(category, '/', '') for category in children.get(None, [])]
+    updated = []
+    while queue:
+        category, parent_path, parent_full_path = queue.pop()
+        category.path = f'{parent_path}{category.id}/'
+        category.full_path = (
+            f'{parent_full_path} > {category.name}' if parent_full_path else category.name
+        )
+        updated.append(category)
+        queue.extend(
+            (child, category.path, category.full_path)
+            for child in children.get(category.id, [])
+        )
+    
+    Category.objects.bulk_update(updated, ['path', 'full_path'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_main_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='full_path',
+            field=models.TextField(blank=True, editable=False, verbose_name='полный путь'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='путь в дереве'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='products_category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(build_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:45
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    # заполнение агрегатов рейтинга по уже промодерированным отзывам
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('reviews', 'Review')
+    histograms = {}
+    counts = Review.objects.filter(is_moderated=True).order_by().values_list(
+        'product_id', 'rating'
+    ).annotate(total=Count('pk'))
+    for product_id, rating, total in counts:
+        histograms.setdefault(product_id, {})[rating] = total
+    
+    products = []
+    for product_id, histogram in histograms.items():
+        count = sum(histogram.values())
+        total = sum(rating * value for rating, value in histogram.items())
+        products.append(Product(
+            pk=product_id,
+            rating_count=count,
+            rating_avg=(Decimal(total) / count).quantize(Decimal('0.01')),
+            **{f'rating_{rating}': histogram.get(rating, 0) for rating in range(1, 6)}
+        ))
+    Product.objects.bulk_update(
+        products,
+        ['rating_count', 'rating_avg', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5'],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_productimage_content_hash'),
+        ('reviews', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='оценок 1'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='оценок 2'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='оценок 3'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='оценок 4'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='оценок 5'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3, verbose_name='средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='количество оценок'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating_avg', 'id'], name='products_rating_avg_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating_count', 'id'], name='products_rating_count_id_idx'),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedProductsBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.BigIntegerField(verbose_name='последний обработанный заказ')),
+                ('orders_processed', models.PositiveIntegerField(default=0, verbose_name='обработано заказов')),
+                ('products_updated', models.PositiveIntegerField(default=0, verbose_name='обновлено товаров')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='дата запуска')),
+            ],
+            options={
+                'verbose_name': 'пересчёт связанных товаров',
+                'verbose_name_plural': 'пересчёты связанных товаров',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductPairCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='количество заказов')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product', verbose_name='купленный вместе товар')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product', verbose_name='товар')),
+            ],
+            options={
+                'verbose_name': 'совместная покупка',
+                'verbose_name_plural': 'совместные покупки',
+                'unique_together': {('product', 'other')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField(verbose_name='количество совместных заказов')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='позиция')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='products.product', verbose_name='товар')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_to_links', to='products.product', verbose_name='связанный товар')),
+            ],
+            options={
+                'verbose_name': 'связанный товар',
+                'verbose_name_plural': 'связанные товары',
+                'ordering': ['product', 'rank'],
+                'indexes': [models.Index(fields=['product', 'rank'], name='products_related_rank_idx')],
+                'unique_together': {('product', 'related')},
+            },
+        ),
+    ]
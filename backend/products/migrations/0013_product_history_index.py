@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-18 01:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_related_products'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicalproduct',
+            index=models.Index(fields=['id', 'history_date'], name='products_history_id_date_idx'),
+        ),
+    ]
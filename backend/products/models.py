@@ -1,7 +1,18 @@
 """
 модели приложения товаров
 """
+import hashlib
+import json
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.core.exceptions import ValidationError
+from django.apps import apps
 from django.db import models
+from django.db.models import Count, DecimalField, F, Value
+from django.db.models.functions import Cast, Coalesce, Concat, NullIf, Round, Substr, Upper
 from django.utils import timezone
 from django.utils.html import format_html
 from django.contrib.admin import display
@@ -10,6 +21,10 @@ from simple_history.models import HistoricalRecords
 
 class Category(models.Model):
     # модель категории с иерархической структурой
+    # дерево хранится в виде материализованного пути: '/1/5/12/'
+    PATH_SEPARATOR = '/'
+    FULL_PATH_SEPARATOR = ' > '
+    
     name = models.CharField('название категории', max_length=100)
     description = models.TextField('описание', blank=True)
     parent = models.ForeignKey(
@@ -21,26 +36,145 @@ class Category(models.Model):
         verbose_name='родительская категория'
     )
     is_active = models.BooleanField('активна', default=True)
+    path = models.CharField('путь в дереве', max_length=255, blank=True, editable=False)
+    full_path = models.TextField('полный путь', blank=True, editable=False)
     created_at = models.DateTimeField('дата создания', default=timezone.now)
     updated_at = models.DateTimeField('дата обновления', auto_now=True)
     
     # отслеживание истории изменений через simple_history
-    history = HistoricalRecords()
+    history = HistoricalRecords(excluded_fields=['path', 'full_path'])
     
     class Meta:
         verbose_name = 'категория'
         verbose_name_plural = 'категории'
         ordering = ['name']
+        indexes = [
+            # индекс для поиска потомков по префиксу пути (LIKE 'prefix%')
+            models.Index(
+                fields=['path'],
+                name='products_category_path_idx',
+                opclasses=['varchar_pattern_ops']
+            ),
+        ]
     
     def __str__(self):
         return self.name
     
     @display(description='полный путь')
     def get_full_path(self):
-        # получение полного пути категории включая родителей
-        if self.parent:
-            return f'{self.parent.get_full_path()} > {self.name}'
-        return self.name
+        # получение полного пути категории включая родителей без рекурсии
+        return self.full_path or self.name
+    
+    def get_descendants(self, include_self=True):
+        # получение всех потомков категории одним запросом по префиксу пути
+        queryset = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+    
+    def can_move_under(self, parent):
+        # категорию нельзя перенести в её собственное поддерево (и в саму себя)
+        return not (self.pk and parent is not None and self.path and parent.path.startswith(self.path))
+    
+    def clean(self):
+        # запрет перемещения категории внутрь собственного поддерева
+        super().clean()
+        if self.parent_id and not self.can_move_under(self.parent):
+            raise ValidationError(
+                {'parent': 'нельзя переместить категорию в её собственную подкатегорию'}
+            )
+    
+    def save(self, *args, **kwargs):
+        # сохранение категории с обновлением материализованного пути поддерева
+        parent = None
+        if self.parent_id:
+            parent = Category.objects.only('path', 'full_path').get(pk=self.parent_id)
+            if not self.can_move_under(parent):
+                raise ValueError('нельзя переместить категорию в её собственную подкатегорию')
+        
+        old_path, old_full_path = self.path, self.full_path
+        super().save(*args, **kwargs)
+        
+        # число подкатегорий входит в ответ родителя: при появлении и переносе
+        # подкатегории сдвигается дата изменения прежнего и нового родителя
+        old_parent_id = self.get_parent_id_from_path(old_path) if old_path else None
+        if old_parent_id != self.parent_id:
+            Category.objects.filter(
+                pk__in=[pk for pk in (old_parent_id, self.parent_id) if pk]
+            ).update(updated_at=timezone.now())
+        
+        if parent is not None:
+            path = f'{parent.path}{self.pk}{self.PATH_SEPARATOR}'
+            full_path = f'{parent.full_path}{self.FULL_PATH_SEPARATOR}{self.name}'
+        else:
+            path = f'{self.PATH_SEPARATOR}{self.pk}{self.PATH_SEPARATOR}'
+            full_path = self.name
+        
+        if (path, full_path) == (old_path, old_full_path):
+            return
+        
+        self.path, self.full_path = path, full_path
+        Category.objects.filter(pk=self.pk).update(path=path, full_path=full_path)
+        if old_path:
+            # перенос или переименование: переписываем префиксы у всего поддерева
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(
+                    Value(path), Substr('path', len(old_path) + 1),
+                    output_field=models.CharField()
+                ),
+                full_path=Concat(
+                    Value(full_path), Substr('full_path', len(old_full_path) + 1),
+                    output_field=models.TextField()
+                ),
+            )
+    
+    @classmethod
+    def get_parent_id_from_path(cls, path):
+        # родитель — предпоследний сегмент пути '/1/5/12/'
+        segments = path.strip(cls.PATH_SEPARATOR).split(cls.PATH_SEPARATOR)
+        return int(segments[-2]) if len(segments) > 1 else None
+    
+    def detach_descendants(self):
+        # перестроение путей поддерева после удаления категории по уцелевшим parent_id
+        # (дочерние категории получают parent = NULL через on_delete=SET_NULL);
+        # поддерево ищется по сегменту id, а не по префиксу: при удалении предка и потомка
+        # одним delete() пути потомков к этому моменту уже переписаны обработчиком предка
+        if self.pk is None:
+            return
+        rows = {
+            row.pk: row
+            for row in Category.objects.filter(
+                path__contains=f'{self.PATH_SEPARATOR}{self.pk}{self.PATH_SEPARATOR}'
+            ).only('id', 'parent_id', 'name', 'path', 'full_path')
+        }
+        if not rows:
+            return
+        children = {}
+        for row in rows.values():
+            children.setdefault(row.parent_id, []).append(row)
+        # вершины поддерева: их родитель удалён или лежит вне перестраиваемых строк
+        parents = Category.objects.only('path', 'full_path').in_bulk(
+            [parent_id for parent_id in children if parent_id is not None and parent_id not in rows]
+        )
+        stack = [row for row in rows.values() if row.parent_id not in rows]
+        now = timezone.now()
+        changed = []
+        while stack:
+            row = stack.pop()
+            parent = rows.get(row.parent_id) or parents.get(row.parent_id)
+            if parent is not None:
+                path = f'{parent.path}{row.pk}{self.PATH_SEPARATOR}'
+                full_path = f'{parent.full_path}{self.FULL_PATH_SEPARATOR}{row.name}'
+            else:
+                path = f'{self.PATH_SEPARATOR}{row.pk}{self.PATH_SEPARATOR}'
+                full_path = row.name
+            if (path, full_path) != (row.path, row.full_path):
+                row.path, row.full_path = path, full_path
+                # у отсоединённых категорий в ответе пропал родитель
+                row.updated_at = now
+                changed.append(row)
+            stack.extend(children.get(row.pk, ()))
+        Category.objects.bulk_update(changed, ['path', 'full_path', 'updated_at'], batch_size=1000)
 
 
 class ProductCategory(models.Model):
@@ -80,28 +214,206 @@ class ProductImage(models.Model):
     is_main = models.BooleanField('основное изображение', default=False)
     alt_text = models.CharField('альтернативный текст', max_length=200, blank=True)
     created_at = models.DateTimeField('дата добавления', default=timezone.now)
+    # уменьшенные копии в webp: {'source': имя исходника, 'variants': {'small': путь, ...}}
+    # заполняется фоновой обработкой после загрузки (products.images)
+    derivatives = models.JSONField('производные изображения', default=dict, blank=True, editable=False)
+    # sha256 содержимого файла: одинаковые загрузки хранятся одним файлом
+    content_hash = models.CharField('хэш содержимого', max_length=64, blank=True, editable=False)
     
     class Meta:
         verbose_name = 'изображение товара'
         verbose_name_plural = 'изображения товаров'
         ordering = ['-is_main', 'created_at']
+        indexes = [
+            models.Index(fields=['content_hash'], name='products_image_hash_idx'),
+        ]
     
     def __str__(self):
         return f'{self.product.name} - {self.id}'
     
+    @staticmethod
+    def hash_file(file):
+        # потоковый подсчёт sha256 без чтения файла целиком в память
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        return hasher.hexdigest()
+    
+    def deduplicate_upload(self):
+        # новый файл с уже сохранённым содержимым заменяется ссылкой на существующий
+        if not self.image or self.image._committed:
+            return
+        # хэш обычно посчитан обработчиком загрузки по мере приёма файла
+        self.content_hash = getattr(self.image.file, 'content_hash', None) or self.hash_file(self.image)
+        existing = ProductImage.objects.filter(content_hash=self.content_hash).exclude(
+            pk=self.pk
+        ).values('image', 'derivatives').first()
+        if existing is not None:
+            self.image = existing['image']
+            if existing['derivatives'].get('source') == existing['image']:
+                self.derivatives = existing['derivatives']
+    
+    def save(self, *args, **kwargs):
+        self.deduplicate_upload()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'image' in update_fields:
+            kwargs['update_fields'] = update_fields = [
+                *update_fields, *{'content_hash', 'derivatives'} - set(update_fields)
+            ]
+        # производные прежнего файла не отдаются для заменённого изображения
+        if self.derivatives and not self.has_current_derivatives():
+            self.derivatives = {}
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'derivatives' not in update_fields:
+                kwargs['update_fields'] = [*update_fields, 'derivatives']
+        super().save(*args, **kwargs)
+    
+    def has_current_derivatives(self):
+        # производные построены для текущего файла изображения
+        return bool(self.image) and self.derivatives.get('source') == self.image.name
+    
+    def get_variant_url(self, name):
+        # url уменьшенной копии, до её готовности - url исходника
+        path = self.derivatives.get('variants', {}).get(name)
+        if path and self.has_current_derivatives():
+            return self.image.storage.url(path)
+        return self.image.url if self.image else ''
+    
     @display(description='превью')
     def image_preview(self):
         # отображение превью изображения в админке
         if self.image:
             return format_html(
                 '<img src="{}" style="width: 100px; height: auto;" />',
-                self.image.url
+                self.get_variant_url('small')
             )
         return ''
 
 
+RATING_AVG_FIELD = DecimalField(max_digits=3, decimal_places=2)
+
+
+def rating_average(total, count):
+    # средняя оценка с округлением до сотых, 0 при отсутствии отзывов
+    return Coalesce(
+        Round(Cast(total, DecimalField(max_digits=12, decimal_places=4)) / NullIf(count, 0), 2),
+        Value(0),
+        output_field=RATING_AVG_FIELD
+    )
+
+
+class ProductQuerySet(models.QuerySet):
+    # набор запросов для товаров
+    
+    def touch(self):
+        # сдвиг даты изменения товаров при правках связанных строк,
+        # которые входят в ответ товара: по этой дате отдаётся Last-Modified
+        return self.update(updated_at=timezone.now())
+    
+    def refresh_main_images(self, touch=False):
+        # пересчёт ссылки на основное изображение одним UPDATE
+        # основное изображение приоритетнее, иначе берём первое добавленное
+        main_image = ProductImage.objects.filter(
+            product=models.OuterRef('pk')
+        ).order_by('-is_main', 'created_at', 'id').values('pk')[:1]
+        fields = {'updated_at': timezone.now()} if touch else {}
+        return self.update(main_image=models.Subquery(main_image), **fields)
+    
+    def apply_rating_changes(self, changes):
+        # инкрементальное обновление агрегатов рейтинга одним UPDATE
+        # changes: {оценка: изменение числа отзывов с этой оценкой}
+        changes = {rating: delta for rating, delta in changes.items() if delta}
+        if not changes:
+            return 0
+        histogram = {
+            f'rating_{rating}': F(f'rating_{rating}') + delta for rating, delta in changes.items()
+        }
+        # в SET выражения видят значения строки до обновления
+        count = F('rating_count') + sum(changes.values())
+        total = sum(
+            (rating * F(f'rating_{rating}') for rating in Product.RATING_VALUES),
+            Value(sum(rating * delta for rating, delta in changes.items()))
+        )
+        return self.update(
+            **histogram, rating_count=count, rating_avg=rating_average(total, count),
+            updated_at=timezone.now()
+        )
+    
+    def refresh_ratings(self):
+        # пересчёт агрегатов рейтинга по промодерированным отзывам
+        reviews = apps.get_model('reviews', 'Review').objects.filter(
+            product=models.OuterRef('pk'), is_moderated=True
+        ).order_by().values('product')
+        
+        def count(**filters):
+            counted = reviews.filter(**filters).annotate(total=Count('pk')).values('total')
+            return Coalesce(models.Subquery(counted), 0)
+        
+        histogram = {f'rating_{rating}': count(rating=rating) for rating in Product.RATING_VALUES}
+        return self.update(
+            **histogram,
+            updated_at=timezone.now(),
+            rating_count=count(),
+            rating_avg=Coalesce(
+                models.Subquery(
+                    reviews.annotate(
+                        average=Round(models.Avg('rating', output_field=RATING_AVG_FIELD), 2)
+                    ).values('average')
+                ),
+                Value(0),
+                output_field=RATING_AVG_FIELD
+            )
+        )
+    
+    def refresh_content_hashes(self):
+        # пересчёт отпечатков с учётом категорий: категории читаются одним запросом,
+        # изменившиеся отпечатки записываются одним bulk_update вместе с датой изменения
+        products = list(self.only('pk', 'content_hash', *Product.CONTENT_HASH_FIELDS))
+        category_ids = Product.get_category_ids([product.pk for product in products])
+        now = timezone.now()
+        changed = []
+        for product in products:
+            content_hash = product.get_content_hash(category_ids[product.pk])
+            if content_hash != product.content_hash:
+                product.content_hash = content_hash
+                product.updated_at = now
+                changed.append(product)
+        if changed:
+            Product.objects.bulk_update(changed, ['content_hash', 'updated_at'])
+        return len(changed)
+
+
+class ProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    # менеджер товаров: поисковый вектор нужен только в условиях поиска,
+    # поэтому в выборки экземпляров он не загружается
+    
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
+class ProductHistoricalRecords(HistoricalRecords):
+    # история товара с индексом под выборку ревизий одного товара по времени
+    
+    def get_meta_options(self, model):
+        meta_fields = super().get_meta_options(model)
+        meta_fields['indexes'] = (
+            *meta_fields.get('indexes', ()),
+            models.Index(fields=['id', 'history_date'], name='products_history_id_date_idx'),
+        )
+        return meta_fields
+
+
 class Product(models.Model):
     # основная модель товара
+    # поля, из которых считается отпечаток содержимого
+    CONTENT_HASH_FIELDS = ('name', 'description', 'price', 'is_active')
+    RATING_VALUES = (1, 2, 3, 4, 5)
+    # денормализованные поля обновляются только UPDATE-запросами сигналов,
+    # обычное сохранение загруженного ранее экземпляра их не перезаписывает
+    DERIVED_FIELDS = (
+        'main_image', 'rating_avg', 'rating_count', *(f'rating_{rating}' for rating in RATING_VALUES),
+    )
+    
     name = models.CharField('название товара', max_length=200)
     description = models.TextField('описание', blank=True)
     price = models.DecimalField('цена', max_digits=10, decimal_places=2)
@@ -119,20 +431,136 @@ class Product(models.Model):
         verbose_name='категории'
     )
     
+    # поисковый вектор для полнотекстового поиска, поддерживается самой базой данных
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('name', weight='A', config='russian')
+            + SearchVector('description', weight='B', config='russian')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+    
+    # денормализованная ссылка на основное изображение
+    # обновляется сигналами при сохранении и удалении ProductImage
+    main_image = models.ForeignKey(
+        ProductImage,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+        verbose_name='основное изображение'
+    )
+    
+    # отпечаток данных из фида поставщика для инкрементальной синхронизации
+    content_hash = models.CharField(
+        'отпечаток содержимого',
+        max_length=64,
+        blank=True,
+        editable=False
+    )
+    
+    # агрегаты промодерированных отзывов, обновляются сигналами отзывов
+    rating_avg = models.DecimalField(
+        'средняя оценка', max_digits=3, decimal_places=2, default=0, editable=False
+    )
+    rating_count = models.PositiveIntegerField('количество оценок', default=0, editable=False)
+    rating_1 = models.PositiveIntegerField('оценок 1', default=0, editable=False)
+    rating_2 = models.PositiveIntegerField('оценок 2', default=0, editable=False)
+    rating_3 = models.PositiveIntegerField('оценок 3', default=0, editable=False)
+    rating_4 = models.PositiveIntegerField('оценок 4', default=0, editable=False)
+    rating_5 = models.PositiveIntegerField('оценок 5', default=0, editable=False)
+    
     # отслеживание истории изменений через simple_history
-    history = HistoricalRecords()
+    history = ProductHistoricalRecords(excluded_fields=[
+        'search_vector', 'main_image', 'content_hash', 'rating_avg', 'rating_count',
+        'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+    ])
+    
+    objects = ProductManager()
     
     class Meta:
         verbose_name = 'товар'
         verbose_name_plural = 'товары'
         ordering = ['-created_at']
+        indexes = [
+            # индексы под сортировки keyset-пагинации (поле + id)
+            models.Index(fields=['created_at', 'id'], name='products_created_id_idx'),
+            models.Index(fields=['price', 'id'], name='products_price_id_idx'),
+            models.Index(fields=['name', 'id'], name='products_name_id_idx'),
+            models.Index(fields=['rating_avg', 'id'], name='products_rating_avg_id_idx'),
+            models.Index(fields=['rating_count', 'id'], name='products_rating_count_id_idx'),
+            GinIndex(fields=['search_vector'], name='products_product_search_idx'),
+            # триграммный индекс для автодополнения с учётом опечаток
+            GinIndex(
+                fields=['name'],
+                name='products_name_trgm_idx',
+                opclasses=['gin_trgm_ops']
+            ),
+            # индекс для поиска артикула по префиксу без учёта регистра
+            models.Index(
+                OpClass(Upper('sku'), name='text_pattern_ops'),
+                name='products_sku_prefix_idx'
+            ),
+        ]
     
     def __str__(self):
         return self.name
     
+    @staticmethod
+    def build_content_hash(name, description, price, is_active, category_ids=()):
+        # отпечаток нормализованных значений полей фида и набора категорий
+        price = Decimal(price).quantize(Decimal('0.01'))
+        raw = json.dumps(
+            [name, description, str(price), bool(is_active), sorted(category_ids)],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def get_category_ids(product_ids):
+        # категории товаров одним запросом: {id товара: [id категорий]}
+        category_ids = defaultdict(list)
+        links = ProductCategory.objects.filter(product_id__in=product_ids).values_list(
+            'product_id', 'category_id'
+        )
+        for product_id, category_id in links:
+            category_ids[product_id].append(category_id)
+        return category_ids
+    
+    def get_content_hash(self, category_ids=None):
+        # без переданных категорий они читаются из базы для сохранённого товара
+        if category_ids is None:
+            category_ids = (
+                self.product_categories.values_list('category_id', flat=True) if self.pk else ()
+            )
+        return self.build_content_hash(
+            *(getattr(self, field) for field in self.CONTENT_HASH_FIELDS), category_ids
+        )
+    
+    def save(self, *args, **kwargs):
+        # отпечаток пересчитывается при любом сохранении через ORM
+        self.content_hash = self.get_content_hash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content_hash' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'content_hash']
+        elif update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # значения денормализованных полей в экземпляре могли устареть
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and not field.generated and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
+    def get_rating_histogram(self):
+        # распределение промодерированных оценок по звёздам
+        return {str(rating): getattr(self, f'rating_{rating}') for rating in self.RATING_VALUES}
+    
     def get_main_image(self):
-        # получение основного изображения товара
-        return self.images.filter(is_main=True).first()
+        # получение основного изображения товара без дополнительных запросов
+        # при использовании select_related('main_image')
+        return self.main_image
     
     @display(description='цена')
     def get_price_with_currency(self):
@@ -143,3 +571,76 @@ class Product(models.Model):
     def get_categories_list(self):
         # получение списка названий категорий
         return ', '.join([c.name for c in self.categories.all()])
+
+
+class ProductPairCount(models.Model):
+    # разреженная матрица совместных покупок: число заказов с обоими товарами
+    # хранится в обе стороны, чтобы соседи товара читались по префиксу индекса
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='товар'
+    )
+    other = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='купленный вместе товар'
+    )
+    count = models.PositiveIntegerField('количество заказов', default=0)
+    
+    class Meta:
+        verbose_name = 'совместная покупка'
+        verbose_name_plural = 'совместные покупки'
+        unique_together = ('product', 'other')
+    
+    def __str__(self):
+        return f'{self.product_id} + {self.other_id}: {self.count}'
+
+
+class RelatedProduct(models.Model):
+    # топ товаров, которые чаще всего покупают вместе с товаром
+    # пересчитывается командой build_related_products
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='related_links',
+        verbose_name='товар'
+    )
+    related = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='related_to_links',
+        verbose_name='связанный товар'
+    )
+    score = models.PositiveIntegerField('количество совместных заказов')
+    rank = models.PositiveSmallIntegerField('позиция')
+    
+    class Meta:
+        verbose_name = 'связанный товар'
+        verbose_name_plural = 'связанные товары'
+        ordering = ['product', 'rank']
+        unique_together = ('product', 'related')
+        indexes = [
+            models.Index(fields=['product', 'rank'], name='products_related_rank_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.product_id} → {self.related_id} ({self.score})'
+
+
+class RelatedProductsBuild(models.Model):
+    # запуск пересчёта связанных товаров и граница обработанных заказов
+    last_order_id = models.BigIntegerField('последний обработанный заказ')
+    orders_processed = models.PositiveIntegerField('обработано заказов', default=0)
+    products_updated = models.PositiveIntegerField('обновлено товаров', default=0)
+    created_at = models.DateTimeField('дата запуска', default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'пересчёт связанных товаров'
+        verbose_name_plural = 'пересчёты связанных товаров'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f'{self.created_at:%Y-%m-%d %H:%M} (до заказа {self.last_order_id})'
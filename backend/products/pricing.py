@@ -0,0 +1,184 @@
+"""
+массовая переоценка товаров по правилам
+"""
+import re
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Case, Exists, IntegerField, Max, OuterRef, Q, Value, When
+from django.utils import timezone
+from simple_history.utils import bulk_update_with_history
+from .cache import invalidate_products
+from .models import Category, Product, ProductCategory
+
+CENT = Decimal('0.01')
+# наибольшая цена, которую вмещает DecimalField цены товара
+PRICE_FIELD = Product._meta.get_field('price')
+MAX_PRICE = Decimal(10) ** (PRICE_FIELD.max_digits - PRICE_FIELD.decimal_places) - CENT
+MAX_PERCENT = Decimal('1000')
+MAX_PREVIEW = 100
+CHANGE_REASON = 'переоценка'
+
+
+def glob_to_regex(pattern):
+    # шаблон артикула вида 'ABC-*' или 'AB?-1*' в регулярное выражение
+    parts = []
+    for char in pattern:
+        if char == '*':
+            parts.append('.*')
+        elif char == '?':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return f'^{"".join(parts)}$'
+
+
+class RepricingRule:
+    # правило переоценки: область товаров и изменение цены
+    # область задаётся категорией (вместе с подкатегориями), шаблоном артикула
+    # и диапазоном текущей цены; заданные условия объединяются через И
+
+    def __init__(self, category=None, sku_pattern=None, price_min=None, price_max=None,
+                 percent=None, amount=None, round_to=None):
+        self.category = category
+        self.sku_pattern = sku_pattern
+        self.price_min = price_min
+        self.price_max = price_max
+        self.percent = percent
+        self.amount = amount
+        self.round_to = round_to
+
+    def get_condition(self):
+        # условие выборки товаров, к которым применяется правило
+        condition = Q()
+        if self.category is not None:
+            path = Category.objects.filter(pk=self.category).values_list('path', flat=True).first()
+            if path is None:
+                return Q(pk__in=[])
+            condition &= Q(Exists(ProductCategory.objects.filter(
+                product=OuterRef('pk'),
+                category__path__startswith=path
+            )))
+        if self.sku_pattern:
+            condition &= Q(sku__iregex=glob_to_regex(self.sku_pattern))
+        if self.price_min is not None:
+            condition &= Q(price__gte=self.price_min)
+        if self.price_max is not None:
+            condition &= Q(price__lte=self.price_max)
+        # правило без области применяется ко всем товарам переданной выборки
+        return condition or Q(pk__isnull=False)
+
+    def apply(self, price):
+        # новая цена: процент, затем сумма, затем округление к окончанию вроде .90
+        if self.percent is not None:
+            price = price * (1 + Decimal(self.percent) / 100)
+        if self.amount is not None:
+            price = price + Decimal(self.amount)
+        if self.round_to is not None:
+            ending = Decimal(self.round_to)
+            price = (price - ending).quantize(Decimal('1'), rounding=ROUND_HALF_UP) + ending
+        return max(price, Decimal('0')).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def check_price_limits(rules, queryset):
+    # новая цена не убывает с ростом старой, поэтому правило достаточно
+    # проверить на самой дорогой подходящей ему цене, одним запросом до записи
+    rows = queryset.order_by().values('repricing_rule').annotate(max_price=Max('price'))
+    for row in rows:
+        new_price = rules[row['repricing_rule']].apply(row['max_price'])
+        if new_price > MAX_PRICE:
+            raise ValueError(
+                f'правило {row["repricing_rule"] + 1}: цена {row["max_price"]} '
+                f'станет {new_price}, больше допустимой {MAX_PRICE}'
+            )
+
+
+class RepricingResult:
+    # итоги переоценки и первые изменения цен для предпросмотра
+
+    def __init__(self):
+        self.matched = 0
+        self.updated = 0
+        self.preview = []
+
+    def add_change(self, product, old_price):
+        self.updated += 1
+        if len(self.preview) < MAX_PREVIEW:
+            self.preview.append({
+                'id': product.pk,
+                'sku': product.sku,
+                'old_price': old_price,
+                'new_price': product.price,
+            })
+
+    def __str__(self):
+        return f'подходит товаров: {self.matched}, изменено цен: {self.updated}'
+
+
+def reprice_products(rules, queryset=None, chunk_size=1000, user=None, dry_run=False):
+    """
+    Reprice products matching the rules in primary key chunks.
+
+    Each product is repriced by the first rule that matches it. Rule
+    matching is done in SQL, the new prices of a chunk are computed
+    together and written with one bulk UPDATE plus one bulk history
+    insert per chunk. Raises ValueError before writing anything if a
+    rule would push a price past the price column's limit.
+    """
+    result = RepricingResult()
+    if not rules:
+        return result
+
+    if queryset is None:
+        queryset = Product.objects.all()
+    # номер первого подходящего правила вычисляется в самом запросе
+    queryset = queryset.prefetch_related(None).annotate(
+        repricing_rule=Case(
+            *(When(rule.get_condition(), then=Value(index)) for index, rule in enumerate(rules)),
+            default=None,
+            output_field=IntegerField()
+        )
+    ).filter(repricing_rule__isnull=False).order_by('pk')
+    check_price_limits(rules, queryset)
+
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            chunk_queryset = queryset.filter(pk__gt=last_pk)
+            if not dry_run:
+                chunk_queryset = chunk_queryset.select_for_update(of=('self',))
+            chunk = list(chunk_queryset[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            result.matched += len(chunk)
+
+            now = timezone.now()
+            changed = []
+            for product in chunk:
+                old_price = product.price
+                product.price = rules[product.repricing_rule].apply(old_price)
+                if product.price > MAX_PRICE:
+                    # цена выросла после предварительной проверки
+                    raise ValueError(f'цена товара {product.sku} станет больше допустимой {MAX_PRICE}')
+                if product.price != old_price:
+                    product.updated_at = now
+                    changed.append(product)
+                    result.add_change(product, old_price)
+
+            if changed and not dry_run:
+                # bulk_update не вызывает save(), поэтому отпечаток считается здесь,
+                # категории изменённых товаров читаются одним запросом
+                category_ids = Product.get_category_ids([product.pk for product in changed])
+                for product in changed:
+                    product.content_hash = product.get_content_hash(category_ids[product.pk])
+                bulk_update_with_history(
+                    changed, Product, ['price', 'content_hash', 'updated_at'],
+                    batch_size=chunk_size,
+                    default_user=user,
+                    default_change_reason=CHANGE_REASON
+                )
+        if changed and not dry_run:
+            # bulk-операции не отправляют сигналы, поэтому кэш сбрасывается явно
+            invalidate_products(*(product.pk for product in changed))
+    return result
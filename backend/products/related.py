@@ -0,0 +1,138 @@
+"""
+пересчёт товаров, которые покупают вместе
+"""
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .cache import invalidate_products
+from .models import ProductPairCount, RelatedProduct, RelatedProductsBuild
+
+# совместные покупки из новых заказов добавляются к накопленным счётчикам
+PAIR_COUNTS_SQL = '''
+    INSERT INTO {pairs} (product_id, other_id, count)
+    SELECT a.product_id, b.product_id, COUNT(DISTINCT a.order_id)
+    FROM {items} a
+    JOIN {items} b ON b.order_id = a.order_id AND b.product_id <> a.product_id
+    WHERE a.order_id > %s AND a.order_id <= %s
+      AND a.product_id IS NOT NULL AND b.product_id IS NOT NULL
+    GROUP BY a.product_id, b.product_id
+    ON CONFLICT (product_id, other_id) DO UPDATE SET count = {pairs}.count + EXCLUDED.count
+    RETURNING product_id
+'''
+
+# топ соседей по убыванию числа совместных заказов; при равенстве — по id
+RELATED_SQL = '''
+    INSERT INTO {related} (product_id, related_id, score, rank)
+    SELECT product_id, other_id, count, rank
+    FROM (
+        SELECT p.product_id, p.other_id, p.count,
+               ROW_NUMBER() OVER (PARTITION BY p.product_id ORDER BY p.count DESC, p.other_id) AS rank
+        FROM {pairs} p
+        WHERE p.product_id = ANY(%s)
+    ) ranked
+    WHERE rank <= %s
+'''
+
+
+class RelatedBuildResult:
+    # итоги пересчёта связанных товаров
+
+    def __init__(self, first_order_id, last_order_id):
+        self.first_order_id = first_order_id
+        self.last_order_id = last_order_id
+        self.products_updated = 0
+
+    def __str__(self):
+        if self.last_order_id <= self.first_order_id:
+            return 'новых заказов нет'
+        return (
+            f'заказы {self.first_order_id + 1}..{self.last_order_id}, '
+            f'обновлено товаров: {self.products_updated}'
+        )
+
+
+def get_settled_order_id(settle_seconds=None):
+    # последний заказ старше задержки: в него больше не добавляют позиции
+    if settle_seconds is None:
+        settle_seconds = settings.RELATED_PRODUCTS_SETTLE_SECONDS
+    Order = apps.get_model('orders', 'Order')
+    border = timezone.now() - timedelta(seconds=settle_seconds)
+    return Order.objects.filter(created_at__lte=border).order_by('-pk').values_list(
+        'pk', flat=True
+    ).first() or 0
+
+
+def rebuild_related(product_ids, limit=None):
+    # перестроение топа соседей для перечисленных товаров
+    limit = limit or settings.RELATED_PRODUCTS_LIMIT
+    RelatedProduct.objects.filter(product_id__in=product_ids).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            RELATED_SQL.format(
+                related=connection.ops.quote_name(RelatedProduct._meta.db_table),
+                pairs=connection.ops.quote_name(ProductPairCount._meta.db_table),
+            ),
+            [list(product_ids), limit]
+        )
+
+
+def build_related_products(full=False, limit=None, settle_seconds=None):
+    """
+    Update co-purchase counts with new orders and rebuild the top-N lists.
+
+    The order-product incidence matrix is multiplied by its transpose in
+    SQL: a self-join of order items on the order id, grouped by product
+    pair, gives the number of orders containing both products. Only orders
+    after the last build's watermark are read, their counts are added to
+    the stored ones, and only products with changed counts get their
+    neighbour list recomputed. With `full` the counts are rebuilt from
+    all orders.
+    """
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    quote = connection.ops.quote_name
+    upper = get_settled_order_id(settle_seconds)
+
+    with transaction.atomic():
+        # один пересчёт за раз: конкурентный запуск ждёт и видит новую границу
+        with connection.cursor() as cursor:
+            cursor.execute('LOCK TABLE %s IN EXCLUSIVE MODE' % quote(RelatedProductsBuild._meta.db_table))
+        if full:
+            ProductPairCount.objects.all().delete()
+            RelatedProduct.objects.all().delete()
+            lower = 0
+        else:
+            lower = RelatedProductsBuild.objects.order_by('-last_order_id').values_list(
+                'last_order_id', flat=True
+            ).first() or 0
+        result = RelatedBuildResult(lower, max(upper, lower))
+        if upper <= lower:
+            return result
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                PAIR_COUNTS_SQL.format(
+                    pairs=quote(ProductPairCount._meta.db_table),
+                    items=quote(OrderItem._meta.db_table),
+                ),
+                [lower, upper]
+            )
+            product_ids = sorted({row[0] for row in cursor.fetchall()})
+
+        if product_ids:
+            rebuild_related(product_ids, limit)
+        result.products_updated = len(product_ids)
+        RelatedProductsBuild.objects.create(
+            last_order_id=upper,
+            orders_processed=OrderItem.objects.filter(
+                order_id__gt=lower, order_id__lte=upper
+            ).values('order_id').distinct().count(),
+            products_updated=len(product_ids)
+        )
+
+    if product_ids:
+        # raw SQL не отправляет сигналы, поэтому кэш товаров сбрасывается явно
+        invalidate_products(*product_ids)
+    return result
@@ -1,8 +1,17 @@
 """
 Serializers for products app.
 """
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, F
 from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
+from .history import DEFAULT_POINTS, MAX_POINTS
+from .images import derivative_urls
 from .models import Category, Product, ProductCategory, ProductImage
+from .pricing import MAX_PERCENT, RepricingRule
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -18,46 +27,281 @@ class CategorySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
     
+    def validate_parent(self, parent):
+        """Reject moving a category under itself or one of its subcategories."""
+        if self.instance is not None and not self.instance.can_move_under(parent):
+            raise serializers.ValidationError('Cannot move a category into its own subcategory.')
+        return parent
+    
     def get_subcategories_count(self, obj):
-        """Get count of subcategories."""
-        return obj.subcategories.count()
+        """Get count of subcategories, annotated by CategoryViewSet when available."""
+        count = getattr(obj, 'subcategories_count', None)
+        if count is None:
+            count = obj.subcategories.count()
+        return count
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
     """Serializer for ProductImage model."""
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_main', 'alt_text', 'created_at']
+        fields = ['id', 'image', 'is_main', 'alt_text', 'created_at', 'srcset']
         read_only_fields = ['created_at']
+    
+    def get_srcset(self, obj):
+        """Get the WebP variant URLs by size name; empty until they are generated."""
+        return derivative_urls(obj.derivatives)
 
 
 class ProductSerializer(serializers.ModelSerializer):
-    """Serializer for Product model."""
+    """
+    Serializer for Product model.
+    
+    Accepts optional `fields` and `expand` arguments for sparse fieldsets:
+    when `fields` is given only those fields (plus the expanded ones) are
+    rendered, and nested relations that are not expanded are rendered as
+    lists of primary keys.
+    """
     images = ProductImageSerializer(many=True, read_only=True)
     categories = CategorySerializer(many=True, read_only=True)
     main_image_url = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'description', 'price', 'sku',
             'is_active', 'created_at', 'updated_at', 'categories',
-            'images', 'main_image_url'
+            'images', 'main_image_url', 'rating_avg', 'rating_count', 'rating_histogram'
         ]
         read_only_fields = ['created_at', 'updated_at']
+        expandable_fields = ['categories', 'images']
+    
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            return
+        expand = set(expand or ())
+        allowed = set(fields) | expand
+        for name in list(self.fields):
+            if name not in allowed:
+                self.fields.pop(name)
+        for name in self.Meta.expandable_fields:
+            if name in self.fields and name not in expand:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    
+    def get_main_image_url(self, obj):
+        """Get main image URL from the denormalized main image reference."""
+        main_image = obj.get_main_image()
+        if main_image:
+            return main_image.image.url
+        return None
+    
+    def get_rating_histogram(self, obj):
+        """Get the number of moderated reviews per star rating."""
+        return obj.get_rating_histogram()
+
+
+class ProductSummarySerializer(serializers.ModelSerializer):
+    """
+    Compact read-only product representation for carts and product lists.
+    
+    Needs only the product row and its main image, so a queryset with
+    select_related('main_image') renders without further queries.
+    """
+    main_image_url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'sku', 'price', 'main_image_url']
+        read_only_fields = fields
     
     def get_main_image_url(self, obj):
-        """Get main image URL."""
-        main_image = obj.images.filter(is_main=True).first()
+        """Get main image URL from the denormalized main image reference."""
+        main_image = obj.get_main_image()
         if main_image:
             return main_image.image.url
-        first_image = obj.images.first()
-        if first_image:
-            return first_image.image.url
         return None
 
 
+class RelatedProductSerializer(ProductSummarySerializer):
+    """Serializer for a product frequently bought together with another one."""
+    score = serializers.IntegerField(read_only=True)
+    
+    class Meta(ProductSummarySerializer.Meta):
+        fields = ProductSummarySerializer.Meta.fields + ['rating_avg', 'rating_count', 'score']
+        read_only_fields = fields
+
+
+class ProductValuesListSerializer(serializers.ListSerializer):
+    """
+    Read-only list serializer rendering products from ``values()`` rows.
+    
+    The output matches ProductSerializer (including sparse fieldsets), but
+    no model instances or per-row serializer trees are built: scalar values
+    go through the child's own field objects, and nested categories and
+    images are loaded with one query each for the whole page.
+    """
+    # SerializerMethodFields resolved from values() columns (a tuple passes several)
+    product_method_columns = {
+        'main_image_url': 'main_image__image',
+        'rating_histogram': tuple(f'rating_{rating}' for rating in Product.RATING_VALUES),
+    }
+    category_method_columns = {'subcategories_count': 'subcategories_count'}
+    image_method_columns = {'srcset': 'derivatives'}
+    nested_fields = ('categories', 'images')
+    # marker for values DRF would leave out of the output
+    skip = object()
+    
+    @classmethod
+    def supports(cls, child):
+        """Check that every field of the child serializer can be rendered from rows."""
+        try:
+            cls.get_plan(child, Product, cls.product_method_columns)
+        except ValueError:
+            return False
+        return True
+    
+    @classmethod
+    def get_columns(cls, child):
+        """Return the values() columns needed to render the child serializer."""
+        plan = cls.get_plan(child, Product, cls.product_method_columns)
+        columns = ['id']
+        for name, column, render in plan:
+            for part in column if isinstance(column, tuple) else (column,):
+                if part not in columns:
+                    columns.append(part)
+        return columns
+    
+    @classmethod
+    def get_plan(cls, serializer, model, method_columns):
+        """Build a (field name, values() column, render function) list in field order."""
+        plan = []
+        for name, field in serializer.fields.items():
+            if name in cls.nested_fields and model is Product:
+                plan.append((name, 'id', None))
+            elif name in method_columns:
+                plan.append((name, method_columns[name], cls.get_method_renderer(name)))
+            else:
+                plan.append((name, *cls.get_field_renderer(model, field)))
+        return plan
+    
+    @classmethod
+    def get_method_renderer(cls, name):
+        """Return the render function for a method field resolved from a column."""
+        if name == 'main_image_url':
+            storage = ProductImage._meta.get_field('image').storage
+            return lambda value: storage.url(value) if value else None
+        if name == 'rating_histogram':
+            return lambda *counts: dict(zip(map(str, Product.RATING_VALUES), counts))
+        if name == 'srcset':
+            return derivative_urls
+        return lambda value: value
+    
+    @classmethod
+    def get_field_renderer(cls, model, field):
+        """Return the (column, render function) pair for a regular field."""
+        if isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer,
+                              serializers.ManyRelatedField)):
+            raise ValueError(f'Unsupported field: {field.field_name}')
+        
+        if '.' in field.source:
+            # DRF skips dotted sources whose intermediate object is missing
+            column = field.source.replace('.', '__')
+            return column, lambda value: cls.skip if value is None else field.to_representation(value)
+        
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise ValueError(f'Unsupported field: {field.field_name}')
+        if model_field.many_to_many or model_field.one_to_many:
+            raise ValueError(f'Unsupported field: {field.field_name}')
+        
+        if isinstance(field, serializers.RelatedField):
+            return field.source, lambda value: (
+                None if value is None else field.to_representation(PKOnlyObject(pk=value))
+            )
+        if isinstance(field, serializers.FileField):
+            return field.source, lambda value: field.to_representation(
+                model_field.attr_class(None, model_field, value)
+            )
+        return field.source, lambda value: None if value is None else field.to_representation(value)
+    
+    @classmethod
+    def render_rows(cls, rows, plan, nested=None):
+        """Render rows according to the plan, resolving nested fields by row id."""
+        nested = nested or {}
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, render in plan:
+                if name in nested:
+                    item[name] = nested[name].get(row['id'], [])
+                    continue
+                if isinstance(column, tuple):
+                    value = render(*(row[part] for part in column))
+                else:
+                    value = render(row[column])
+                if value is not cls.skip:
+                    item[name] = value
+            data.append(item)
+        return data
+    
+    def load_categories(self, field, product_ids):
+        """Load the categories of all products on the page, grouped by product id."""
+        grouped = {}
+        if isinstance(field, serializers.ManyRelatedField):
+            links = ProductCategory.objects.filter(product_id__in=product_ids).order_by(
+                'category__name', 'category_id'
+            ).values_list('product_id', 'category_id')
+            for product_id, category_id in links:
+                grouped.setdefault(product_id, []).append(
+                    field.child_relation.to_representation(PKOnlyObject(pk=category_id))
+                )
+            return grouped
+        
+        plan = self.get_plan(field.child, Category, self.category_method_columns)
+        rows = Category.objects.filter(category_products__product_id__in=product_ids).annotate(
+            linked_product_id=F('category_products__product_id'),
+            subcategories_count=Count('subcategories')
+        ).order_by('name', 'id').values('linked_product_id', 'id', *(column for _, column, _ in plan))
+        for row, item in zip(rows, self.render_rows(rows, plan)):
+            grouped.setdefault(row['linked_product_id'], []).append(item)
+        return grouped
+    
+    def load_images(self, field, product_ids):
+        """Load the images of all products on the page, grouped by product id."""
+        grouped = {}
+        images = ProductImage.objects.filter(product_id__in=product_ids).order_by(
+            '-is_main', 'created_at', 'id'
+        )
+        if isinstance(field, serializers.ManyRelatedField):
+            for product_id, image_id in images.values_list('product_id', 'id'):
+                grouped.setdefault(product_id, []).append(
+                    field.child_relation.to_representation(PKOnlyObject(pk=image_id))
+                )
+            return grouped
+        
+        plan = self.get_plan(field.child, ProductImage, self.image_method_columns)
+        rows = images.values('product_id', 'id', *(column for _, column, _ in plan))
+        for row, item in zip(rows, self.render_rows(rows, plan)):
+            grouped.setdefault(row['product_id'], []).append(item)
+        return grouped
+    
+    def to_representation(self, data):
+        rows = list(data)
+        product_ids = [row['id'] for row in rows]
+        nested = {}
+        if 'categories' in self.child.fields:
+            nested['categories'] = self.load_categories(self.child.fields['categories'], product_ids)
+        if 'images' in self.child.fields:
+            nested['images'] = self.load_images(self.child.fields['images'], product_ids)
+        plan = self.get_plan(self.child, Product, self.product_method_columns)
+        return self.render_rows(rows, plan, nested)
+
+
 class ProductCategorySerializer(serializers.ModelSerializer):
     """Serializer for ProductCategory model."""
     product_name = serializers.CharField(source='product.name', read_only=True)
@@ -67,3 +311,76 @@ class ProductCategorySerializer(serializers.ModelSerializer):
         model = ProductCategory
         fields = ['id', 'product', 'product_name', 'category', 'category_name', 'created_at']
         read_only_fields = ['created_at']
+
+
+class RepricingRuleSerializer(serializers.Serializer):
+    """Serializer for a single repricing rule."""
+    category = serializers.IntegerField(required=False)
+    sku_pattern = serializers.CharField(required=False, max_length=50)
+    price_min = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    price_max = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    percent = serializers.DecimalField(
+        max_digits=6, decimal_places=2, max_value=MAX_PERCENT, required=False
+    )
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    round_to = serializers.DecimalField(
+        max_digits=3, decimal_places=2, min_value=0, max_value=Decimal('0.99'), required=False
+    )
+    
+    def validate(self, attrs):
+        """Require a scope and a price change."""
+        if not any(name in attrs for name in ('category', 'sku_pattern', 'price_min', 'price_max')):
+            raise serializers.ValidationError(
+                'Specify category, sku_pattern or a price range.'
+            )
+        if not any(name in attrs for name in ('percent', 'amount', 'round_to')):
+            raise serializers.ValidationError('Specify percent, amount or round_to.')
+        if 'percent' in attrs and attrs['percent'] <= -100:
+            raise serializers.ValidationError({'percent': 'Must be greater than -100.'})
+        return attrs
+
+
+class RepricingSerializer(serializers.Serializer):
+    """Serializer for a bulk repricing request."""
+    rules = RepricingRuleSerializer(many=True, allow_empty=False)
+    dry_run = serializers.BooleanField(default=False)
+    
+    def get_rules(self):
+        """Return the validated rules in the order they were given."""
+        return [RepricingRule(**attrs) for attrs in self.validated_data['rules']]
+
+
+class SuggestQuerySerializer(serializers.Serializer):
+    """Serializer for autocomplete query parameters."""
+    q = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False, default='')
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.PRODUCT_SUGGEST_LIMIT,
+        default=settings.PRODUCT_SUGGEST_LIMIT
+    )
+
+
+class PriceHistoryQuerySerializer(serializers.Serializer):
+    """Serializer for price history query parameters."""
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    points = serializers.IntegerField(min_value=2, max_value=MAX_POINTS, default=DEFAULT_POINTS)
+    
+    def validate(self, attrs):
+        """Require a non-empty time range."""
+        if 'since' in attrs and 'until' in attrs and attrs['since'] >= attrs['until']:
+            raise serializers.ValidationError({'until': 'Must be later than since.'})
+        return attrs
+
+
+class PriceHistoryPointSerializer(serializers.BaseSerializer):
+    """Serializer rendering a (timestamp, price) pair as a two-item list."""
+    timestamp_field = serializers.DateTimeField()
+    price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+    
+    def to_representation(self, instance):
+        timestamp, price = instance
+        return [
+            self.timestamp_field.to_representation(timestamp),
+            self.price_field.to_representation(price),
+        ]
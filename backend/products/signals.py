@@ -0,0 +1,85 @@
+"""
+обработчики сигналов приложения товаров
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .cache import invalidate_categories, invalidate_products
+from .images import schedule_derivatives
+from .models import Category, Product, ProductCategory, ProductImage
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def update_product_main_image(sender, instance, **kwargs):
+    # пересчёт основного изображения товара при изменении его изображений;
+    # изображения входят в ответ товара, поэтому сдвигается и дата его изменения
+    Product.objects.filter(pk=instance.product_id).refresh_main_images(touch=True)
+
+
+@receiver(post_save, sender=ProductImage)
+def generate_product_image_derivatives(sender, instance, **kwargs):
+    # фоновая генерация уменьшенных копий для нового или заменённого файла
+    if instance.image and not instance.has_current_derivatives():
+        schedule_derivatives(instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def detach_category_descendants(sender, instance, **kwargs):
+    # перенос поддерева удалённой категории в корень дерева
+    instance.detach_descendants()
+    # у родителя стало меньше подкатегорий
+    if instance.parent_id:
+        Category.objects.filter(pk=instance.parent_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    # инвалидация кэша ответов при изменении товара
+    invalidate_products(instance.pk)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def invalidate_related_product_cache(sender, instance, **kwargs):
+    # инвалидация кэша ответов при изменении изображений и категорий товара
+    invalidate_products(instance.product_id)
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def refresh_product_content_hash(sender, instance, **kwargs):
+    # отпечаток товара включает его категории; при его смене сдвигается и дата изменения
+    Product.objects.filter(pk=instance.product_id).refresh_content_hashes()
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def refresh_product_categories_content_hash(sender, instance, action, reverse, pk_set, **kwargs):
+    # product.categories.add()/remove() пишут связи без сигналов модели связи
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        Product.objects.filter(pk__in=pk_set or ()).refresh_content_hashes()
+    else:
+        Product.objects.filter(pk=instance.pk).refresh_content_hashes()
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def invalidate_product_categories_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    # инвалидация при изменении категорий через product.categories.add()/remove()
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        invalidate_products(*(pk_set or ()))
+    else:
+        invalidate_products(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    # инвалидация кэша категорий и дерева при любом изменении категории
+    invalidate_categories()
@@ -0,0 +1,56 @@
+"""
+автодополнение товаров по названию и артикулу
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db.models import Q
+from .models import Product, ProductImage
+
+SUGGEST_MIN_LENGTH = 2
+
+
+def normalize_prefix(value):
+    # нормализация введённой строки: регистр и лишние пробелы
+    return ' '.join(value.lower().split())
+
+
+def find_suggestions(prefix, limit):
+    # поиск подсказок по триграммному индексу названия и префиксному индексу артикула
+    rows = (
+        Product.objects.filter(is_active=True)
+        .filter(Q(name__trigram_word_similar=prefix) | Q(sku__istartswith=prefix))
+        .annotate(similarity=TrigramWordSimilarity(prefix, 'name'))
+        .order_by('-similarity', 'name')
+        .values('id', 'name', 'main_image__image')[:limit]
+    )
+    storage = ProductImage._meta.get_field('image').storage
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'main_image_url': (
+                storage.url(row['main_image__image'])
+                if row['main_image__image'] else None
+            ),
+        }
+        for row in rows
+    ]
+
+
+def get_suggestions(value, limit=None):
+    # подсказки для строки поиска с коротким кэшем по нормализованному префиксу
+    prefix = normalize_prefix(value)
+    if len(prefix) < SUGGEST_MIN_LENGTH:
+        return []
+    limit = max(1, min(limit or settings.PRODUCT_SUGGEST_LIMIT, settings.PRODUCT_SUGGEST_LIMIT))
+    
+    digest = hashlib.md5(prefix.encode()).hexdigest()
+    cache_key = f'products:suggest:{digest}:{limit}'
+    suggestions = cache.get(cache_key)
+    if suggestions is None:
+        suggestions = find_suggestions(prefix, limit)
+        cache.set(cache_key, suggestions, timeout=settings.PRODUCT_SUGGEST_CACHE_TIMEOUT)
+    return suggestions
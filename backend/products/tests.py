@@ -0,0 +1,394 @@
+"""
+тесты приложения товаров
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from reviews.models import Review
+from .importers import ProductImporter, ProductSync
+from .models import Category, Product, ProductCategory, ProductImage
+
+
+class ProductDerivedFieldsTests(TestCase):
+    # сохранение устаревшего экземпляра не откатывает денормализованные поля
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(email='admin@example.com', password='p')
+        self.product = Product.objects.create(name='Чайник', sku='KT-1', price=Decimal('100.00'))
+    
+    def post_review(self, rating):
+        author = get_user_model().objects.create_user(
+            email=f'author{Review.objects.count()}@example.com', password='p'
+        )
+        return Review.objects.create(
+            user=author, product=self.product, rating=rating, is_moderated=True
+        )
+    
+    def test_stale_save_keeps_rating_aggregates(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self.post_review(5)
+        
+        stale.name = 'Электрочайник'
+        stale.save()
+        
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.name, 'Электрочайник')
+        self.assertEqual(product.rating_count, 1)
+        self.assertEqual(product.rating_5, 1)
+        self.assertEqual(product.rating_avg, Decimal('5.00'))
+        
+        # следующий отзыв продолжает счётчики с сохранённых значений
+        self.post_review(3)
+        product.refresh_from_db()
+        self.assertEqual(product.rating_count, 2)
+        self.assertEqual(product.rating_avg, Decimal('4.00'))
+    
+    def test_stale_save_keeps_main_image(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        image = ProductImage.objects.create(product=self.product, image='products/a.jpg', is_main=True)
+        
+        stale.price = Decimal('90.00')
+        stale.save()
+        
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.main_image_id, image.pk)
+        self.assertEqual(self.product.price, Decimal('90.00'))
+    
+    def test_api_update_keeps_rating_aggregates(self):
+        self.post_review(4)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        
+        response = client.patch(
+            f'/api/v1/products/{self.product.pk}/', {'price': '120.00'}, format='json'
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal('120.00'))
+        self.assertEqual(self.product.rating_count, 1)
+        self.assertEqual(self.product.rating_avg, Decimal('4.00'))
+
+
+class ConditionalGetAssertions:
+    # оба валидатора детального ответа меняются при правке, отражённой в ответе
+    
+    def backdate(self):
+        # отметки времени уводятся в прошлое, чтобы правка в ту же секунду сдвинула дату
+        raise NotImplementedError
+    
+    def assertChanged(self, write):
+        self.backdate()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        
+        write()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['Last-Modified'], last_modified)
+
+
+class ProductConditionalGetTests(ConditionalGetAssertions, TestCase):
+    # связанные правки сдвигают дату изменения товара и меняют ETag
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.started = timezone.now()
+        self.product = Product.objects.create(name='Чайник', sku='KT-2', price=Decimal('100.00'))
+        self.category = Category.objects.create(name='Кухня')
+        self.image = ProductImage.objects.create(
+            product=self.product, image='products/a.jpg', alt_text='чайник', is_main=True
+        )
+        self.url = f'/api/v1/products/{self.product.pk}/'
+    
+    def backdate(self):
+        past = timezone.now() - timedelta(hours=1)
+        Product.objects.filter(pk=self.product.pk).update(updated_at=past)
+        Category.objects.filter(created_at__gte=self.started).update(updated_at=past)
+    
+    def test_rating_change(self):
+        user = get_user_model().objects.create_user(email='reviewer@example.com', password='p')
+        self.assertChanged(lambda: Review.objects.create(
+            user=user, product=self.product, rating=4, is_moderated=True
+        ))
+    
+    def test_category_link_added(self):
+        self.assertChanged(lambda: ProductCategory.objects.create(
+            product=self.product, category=self.category
+        ))
+    
+    def test_category_link_removed(self):
+        link = ProductCategory.objects.create(product=self.product, category=self.category)
+        self.assertChanged(link.delete)
+    
+    def test_latest_image_deleted(self):
+        image = ProductImage.objects.create(product=self.product, image='products/b.jpg')
+        self.assertChanged(image.delete)
+    
+    def test_image_alt_text_changed(self):
+        def write():
+            self.image.alt_text = 'электрочайник'
+            self.image.save()
+        self.assertChanged(write)
+    
+    def test_main_image_changed(self):
+        image = ProductImage.objects.create(product=self.product, image='products/b.jpg')
+        
+        def write():
+            ProductImage.objects.filter(pk=self.image.pk).update(is_main=False)
+            image.is_main = True
+            image.save()
+        self.assertChanged(write)
+    
+    def test_category_renamed(self):
+        ProductCategory.objects.create(product=self.product, category=self.category)
+        
+        def write():
+            self.category.name = 'Кухня и столовая'
+            self.category.save()
+        self.assertChanged(write)
+    
+    def test_parent_category_renamed(self):
+        parent = Category.objects.create(name='Дом')
+        self.category.parent = parent
+        self.category.save()
+        ProductCategory.objects.create(product=self.product, category=self.category)
+        
+        def write():
+            parent.name = 'Для дома'
+            parent.save()
+        self.assertChanged(write)
+
+
+class CategoryConditionalGetTests(ConditionalGetAssertions, TestCase):
+    # число подкатегорий и родитель в ответе категории сдвигают её дату изменения
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.started = timezone.now()
+        self.category = Category.objects.create(name='Кухня')
+        self.url = f'/api/v1/categories/{self.category.pk}/'
+    
+    def backdate(self):
+        Category.objects.filter(created_at__gte=self.started).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+    
+    def test_subcategory_added(self):
+        self.assertChanged(lambda: Category.objects.create(name='Посуда', parent=self.category))
+    
+    def test_subcategory_moved_away(self):
+        child = Category.objects.create(name='Посуда', parent=self.category)
+        
+        def write():
+            child.parent = None
+            child.save()
+        self.assertChanged(write)
+    
+    def test_subcategory_deleted(self):
+        child = Category.objects.create(name='Посуда', parent=self.category)
+        self.assertChanged(child.delete)
+    
+    def test_parent_deleted(self):
+        parent = Category.objects.create(name='Дом')
+        self.category.parent = parent
+        self.category.save()
+        self.assertChanged(parent.delete)
+
+
+class ProductSuggestTests(TestCase):
+    # некорректный limit подсказок отклоняется с 400, а не роняет запрос
+    
+    def setUp(self):
+        self.client = APIClient()
+    
+    def test_invalid_limit_is_rejected(self):
+        for limit in ('-1', '0', 'abc', '1000'):
+            with self.subTest(limit=limit):
+                response = self.client.get('/api/v1/products/suggest/', {'q': 'чай', 'limit': limit})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('limit', response.data)
+    
+    def test_short_prefix_returns_no_suggestions(self):
+        response = self.client.get('/api/v1/products/suggest/', {'q': 'ч', 'limit': '3'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+
+class ProductImporterTests(TestCase):
+    # значения, не помещающиеся в поля товара, становятся ошибками строк
+    
+    def test_oversized_values_are_row_errors(self):
+        rows = [
+            {'sku': 'OK-1', 'name': 'Чайник', 'price': '100.00'},
+            {'sku': 'X' * 51, 'name': 'Чайник', 'price': '100.00'},
+            {'sku': 'LONG-NAME', 'name': 'Ч' * 201, 'price': '100.00'},
+            {'sku': 'BIG-PRICE', 'name': 'Чайник', 'price': '100000000'},
+            {'sku': 'NAN-PRICE', 'name': 'Чайник', 'price': 'NaN'},
+            {'sku': 'OK-2', 'name': 'Ч' * 200, 'price': '99999999.99'},
+        ]
+        
+        result = ProductImporter(chunk_size=2).run(rows)
+        
+        self.assertEqual(result.created, 2)
+        self.assertEqual([line for line, _ in result.errors], [2, 3, 4, 5])
+        self.assertEqual(
+            set(Product.objects.filter(sku__in=[row['sku'] for row in rows]).values_list('sku', flat=True)),
+            {'OK-1', 'OK-2'}
+        )
+
+
+class RepricingLimitTests(TestCase):
+    # правило, выводящее цену за пределы поля, отклоняется до записи
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(email='admin@example.com', password='p')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cheap = Product.objects.create(name='Чайник', sku='RP-1', price=Decimal('100.00'))
+        self.expensive = Product.objects.create(name='Плита', sku='RP-2', price=Decimal('50000000.00'))
+    
+    def reprice(self, **rule):
+        return self.client.post(
+            '/api/v1/products/reprice/', {'rules': [{'sku_pattern': 'RP-*', **rule}]}, format='json'
+        )
+    
+    def test_overflowing_rule_changes_nothing(self):
+        response = self.reprice(percent='100')
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('rules', response.data)
+        self.cheap.refresh_from_db()
+        self.expensive.refresh_from_db()
+        self.assertEqual(self.cheap.price, Decimal('100.00'))
+        self.assertEqual(self.expensive.price, Decimal('50000000.00'))
+    
+    def test_oversized_percent_is_rejected(self):
+        response = self.reprice(percent='5000')
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('percent', response.data['rules'][0])
+    
+    def test_rule_within_limits_is_applied(self):
+        response = self.reprice(percent='10')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.expensive.refresh_from_db()
+        self.assertEqual(self.expensive.price, Decimal('55000000.00'))
+
+
+class ProductSyncCategoriesTests(TestCase):
+    # фид, меняющий только категории товара, применяется синхронизацией
+    
+    def setUp(self):
+        self.kitchen = Category.objects.create(name='Кухня')
+        self.appliances = Category.objects.create(name='Техника')
+        self.row = {'sku': 'SYNC-1', 'name': 'Чайник', 'price': '100.00'}
+        ProductSync(deactivate_missing=False).run([{**self.row, 'categories': str(self.kitchen.pk)}])
+        self.product = Product.objects.get(sku='SYNC-1')
+    
+    def category_ids(self):
+        return set(self.product.product_categories.values_list('category_id', flat=True))
+    
+    def test_category_change_replaces_links(self):
+        result = ProductSync(deactivate_missing=False).run(
+            [{**self.row, 'categories': str(self.appliances.pk)}]
+        )
+        
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(self.category_ids(), {self.appliances.pk})
+        
+        # повтор того же фида ничего не меняет
+        result = ProductSync(deactivate_missing=False).run(
+            [{**self.row, 'categories': str(self.appliances.pk)}]
+        )
+        self.assertEqual((result.updated, result.unchanged), (0, 1))
+    
+    def test_links_edited_outside_sync_are_restored(self):
+        self.product.categories.add(self.appliances)
+        
+        result = ProductSync(deactivate_missing=False).run(
+            [{**self.row, 'categories': str(self.kitchen.pk)}]
+        )
+        
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(self.category_ids(), {self.kitchen.pk})
+
+
+class ProductSearchTests(TestCase):
+    # поиск находит товары по словам названия и по началу артикула без учёта регистра
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.kettle = Product.objects.create(name='Электрический чайник', sku='KTL-2000', price=Decimal('100.00'))
+        self.toaster = Product.objects.create(name='Тостер', sku='TST-100', price=Decimal('50.00'))
+    
+    def search(self, text):
+        response = self.client.get('/api/v1/products/', {'search': text})
+        self.assertEqual(response.status_code, 200)
+        return {row['id'] for row in response.data['results']}
+    
+    def test_sku_prefix_is_case_insensitive(self):
+        self.assertEqual(self.search('ktl-2'), {self.kettle.pk})
+        self.assertEqual(self.search('tst'), {self.toaster.pk})
+    
+    def test_name_words_match(self):
+        self.assertIn(self.kettle.pk, self.search('чайники'))
+    
+    def test_instances_do_not_load_search_vector(self):
+        product = Product.objects.get(pk=self.kettle.pk)
+        
+        self.assertIn('search_vector', product.get_deferred_fields())
+
+
+class CategoryMoveTests(TestCase):
+    # перенос категории в собственное поддерево отклоняется ошибкой проверки
+    
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(email='admin@example.com', password='p')
+        self.root = Category.objects.create(name='Дом')
+        self.child = Category.objects.create(name='Кухня', parent=self.root)
+        self.grandchild = Category.objects.create(name='Посуда', parent=self.child)
+    
+    def test_api_rejects_move_into_subtree(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        
+        for parent in (self.grandchild, self.root):
+            with self.subTest(parent=parent.name):
+                response = client.patch(
+                    f'/api/v1/categories/{self.root.pk}/', {'parent': parent.pk}, format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('parent', response.data)
+        self.root.refresh_from_db()
+        self.assertIsNone(self.root.parent_id)
+    
+    def test_admin_rejects_move_into_subtree(self):
+        self.client.force_login(self.user)
+        
+        response = self.client.post(f'/admin/products/category/{self.root.pk}/change/', {
+            'name': self.root.name,
+            'description': '',
+            'parent': self.grandchild.pk,
+            'is_active': 'on',
+            'subcategories-TOTAL_FORMS': '0',
+            'subcategories-INITIAL_FORMS': '0',
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('parent', response.context['adminform'].form.errors)
+        self.root.refresh_from_db()
+        self.assertIsNone(self.root.parent_id)
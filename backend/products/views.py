@@ -1,13 +1,46 @@
 """
 Views for products app.
 """
-from rest_framework import viewsets, filters
+from rest_framework import filters, mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from django.db.models import Count, F, Max, Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
+from core.conditional import ConditionalGetMixin
+from core.pagination import OptionalKeysetPagination
+from .cache import (
+    CATEGORIES_SCOPE,
+    PRODUCTS_SCOPE,
+    CachedResponseMixin,
+    get_category_tree,
+    get_versions,
+    product_scope,
+)
+from .exporters import EXPORT_CONTENT_TYPES, EXPORT_FORMATS, CatalogExporter
+from .facets import get_facets
+from .history import get_price_history
+from .filters import ProductFilter, ProductSearchFilter
 from .models import Category, Product, ProductImage
-from .serializers import CategorySerializer, ProductSerializer, ProductImageSerializer
+from .pricing import reprice_products
+from .serializers import (
+    CategorySerializer,
+    ProductImageSerializer,
+    PriceHistoryPointSerializer,
+    PriceHistoryQuerySerializer,
+    ProductSerializer,
+    ProductValuesListSerializer,
+    RelatedProductSerializer,
+    RepricingSerializer,
+    SuggestQuerySerializer,
+)
+from .suggest import get_suggestions
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """ViewSet for Category model."""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -16,30 +49,254 @@ class CategoryViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
+    conditional_timestamp_fields = ('updated_at', 'parent_updated_at')
     
     def get_queryset(self):
-        return super().get_queryset().prefetch_related('subcategories')
+        return super().get_queryset().select_related('parent').annotate(
+            subcategories_count=Count('subcategories')
+        )
+    
+    def get_conditional_queryset(self):
+        return Category.objects.values('updated_at').annotate(
+            parent_updated_at=F('parent__updated_at'),
+            subcategories_count=Count('subcategories')
+        )
+    
+    def get_conditional_extra(self):
+        # массовые правки категорий через update() меняют только версию кэша
+        return get_versions(*self.get_cache_scopes())
+    
+    def get_cache_scopes(self):
+        return [CATEGORIES_SCOPE]
+    
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def tree(self, request):
+        """Get the nested tree of active categories."""
+        return Response(get_category_tree())
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """ViewSet for Product model."""
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = {
-        'price': ['gte', 'lte'],
-        'categories': ['exact'],
-        'is_active': ['exact'],
-    }
-    search_fields = ['name', 'description', 'sku']
-    ordering_fields = ['price', 'created_at', 'name']
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, ProductSearchFilter]
+    filterset_class = ProductFilter
+    ordering_fields = ['price', 'created_at', 'name', 'rating_avg', 'rating_count']
     ordering = ['-created_at']
+    pagination_class = OptionalKeysetPagination
+    cursor_ordering_fields = ['created_at', 'price', 'name', 'rating_avg', 'rating_count']
+    use_values_list = True
+    conditional_timestamp_fields = ('updated_at', 'categories_updated_at', 'categories_parent_updated_at')
     
     def get_queryset(self):
-        return super().get_queryset().prefetch_related('categories', 'images')
+        queryset = super().get_queryset()
+        fields, expand = self.get_sparse_fields()
+        if fields is None:
+            fields = expand = set(ProductSerializer.Meta.fields)
+        else:
+            fields = fields | expand
+        
+        # relations left out of the response are not loaded at all;
+        # nested orderings are explicit (Meta.ordering is dropped under GROUP BY)
+        categories = Category.objects.order_by('name', 'id')
+        images = ProductImage.objects.order_by('-is_main', 'created_at', 'id')
+        if 'main_image_url' in fields:
+            queryset = queryset.select_related('main_image')
+        if 'categories' in expand:
+            categories = categories.select_related('parent').annotate(
+                subcategories_count=Count('subcategories')
+            )
+            queryset = queryset.prefetch_related(Prefetch('categories', queryset=categories))
+        elif 'categories' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('categories', queryset=categories.only('id'))
+            )
+        if 'images' in expand:
+            queryset = queryset.prefetch_related(Prefetch('images', queryset=images))
+        elif 'images' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=images.only('id', 'product_id'))
+            )
+        if 'description' not in fields:
+            queryset = queryset.defer('description')
+        return queryset
+    
+    def get_conditional_queryset(self):
+        # состояние товара вместе с изображениями и категориями одной строкой
+        return Product.objects.values(
+            'updated_at', 'main_image_id', 'rating_avg', 'rating_count',
+            *(f'rating_{rating}' for rating in Product.RATING_VALUES)
+        ).annotate(
+            categories_updated_at=Max('categories__updated_at'),
+            categories_parent_updated_at=Max('categories__parent__updated_at'),
+            categories_count=Count('categories', distinct=True),
+            images_created_at=Max('images__created_at'),
+            images_count=Count('images', distinct=True),
+            images_last_id=Max('images__id'),
+            images_ready=Count('images', filter=~Q(images__derivatives={}), distinct=True)
+        )
+    
+    def get_conditional_extra(self):
+        # версии кэша меняются и при правках через update() в обход дат изменения,
+        # поэтому версии входят в ETag
+        return get_versions(*self.get_cache_scopes())
+    
+    def get_sparse_fields(self):
+        """Return the requested (fields, expand) sets; fields is None when not restricted."""
+        if self.action not in ('list', 'retrieve'):
+            return None, set()
+        
+        def parse(param):
+            value = self.request.query_params.get(param)
+            if value is None:
+                return None
+            return {name.strip() for name in value.split(',') if name.strip()}
+        
+        return parse('fields'), parse('expand') or set()
+    
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+    
+    def get_cache_scopes(self):
+        if self.action == 'retrieve':
+            product_id = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            return [product_scope(product_id), CATEGORIES_SCOPE]
+        if self.action == 'price_history':
+            return [product_scope(self.kwargs[self.lookup_url_kwarg or self.lookup_field])]
+        if self.action == 'related':
+            # список соседей меняется вместе с товаром, а их данные — с любым товаром
+            return [product_scope(self.kwargs[self.lookup_url_kwarg or self.lookup_field]), PRODUCTS_SCOPE]
+        return [PRODUCTS_SCOPE, CATEGORIES_SCOPE]
+    
+    def list(self, request, *args, **kwargs):
+        """List products, with facet counts when ?facets=true is passed."""
+        response = self.get_cached_response(self.list_products, request, *args, **kwargs)
+        if request.query_params.get('facets', '').lower() in ('1', 'true', 'yes'):
+            response.data['facets'] = get_facets(
+                request.query_params, lambda: self.filter_queryset(self.get_queryset())
+            )
+        return response
+    
+    def list_products(self, request, *args, **kwargs):
+        """List products from values() rows when the serializer allows it."""
+        serializer = self.get_serializer()
+        if not (self.use_values_list and ProductValuesListSerializer.supports(serializer)):
+            return mixins.ListModelMixin.list(self, request, *args, **kwargs)
+        
+        columns = ProductValuesListSerializer.get_columns(serializer)
+        # keyset pagination reads the ordering columns from the rows
+        columns += [name for name in self.cursor_ordering_fields if name not in columns]
+        rows = self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*columns)
+        
+        page = self.paginate_queryset(rows)
+        data = ProductValuesListSerializer(
+            rows if page is None else page,
+            child=serializer,
+            context=self.get_serializer_context()
+        ).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
     
     def perform_create(self, serializer):
         serializer.save()
+    
+    @action(detail=False, methods=['get'], pagination_class=None, filter_backends=[])
+    def suggest(self, request):
+        """Get typo-tolerant autocomplete suggestions for a search prefix."""
+        params = SuggestQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(get_suggestions(params.validated_data['q'], params.validated_data['limit']))
+    
+    @action(detail=True, methods=['get'], pagination_class=None, filter_backends=[])
+    def related(self, request, pk=None):
+        """Get the active products most often bought together with this one."""
+        return self.get_cached_response(self.list_related, request, pk=pk)
+    
+    def list_related(self, request, pk=None):
+        """List precomputed related products in rank order."""
+        product = get_object_or_404(Product.objects.only('id'), pk=pk)
+        products = Product.objects.filter(
+            related_to_links__product=product,
+            is_active=True
+        ).annotate(
+            score=F('related_to_links__score')
+        ).select_related('main_image').defer('description').order_by('related_to_links__rank')
+        return Response(RelatedProductSerializer(
+            products, many=True, context=self.get_serializer_context()
+        ).data)
+    
+    @action(
+        detail=True,
+        methods=['get'],
+        url_path='price-history',
+        pagination_class=None,
+        filter_backends=[]
+    )
+    def price_history(self, request, pk=None):
+        """Get the product's price changes as [timestamp, price] points (?since=&until=&points=)."""
+        return self.get_cached_response(self.list_price_history, request, pk=pk)
+    
+    def list_price_history(self, request, pk=None):
+        """List price change points read from the historical records."""
+        product = get_object_or_404(Product.objects.only('id'), pk=pk)
+        params = PriceHistoryQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        points = get_price_history(product.pk, **params.validated_data)
+        return Response({
+            'id': product.pk,
+            'points': PriceHistoryPointSerializer(points, many=True).data,
+        })
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser], pagination_class=None)
+    def export(self, request):
+        """Stream the filtered catalog as CSV, JSONL or a YML feed (?file_format=)."""
+        export_format = request.query_params.get('file_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'file_format': [f'Choose one of: {", ".join(EXPORT_FORMATS)}.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        exporter = CatalogExporter(
+            queryset=self.filter_queryset(Product.objects.all()),
+            base_url=request.build_absolute_uri('/')
+        )
+        response = StreamingHttpResponse(
+            exporter.export(export_format),
+            content_type=EXPORT_CONTENT_TYPES[export_format]
+        )
+        filename = f'products-{timezone.now():%Y%m%d-%H%M}.{export_format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=[IsAdminUser],
+        serializer_class=RepricingSerializer
+    )
+    def reprice(self, request):
+        """Reprice products by rules; each product uses the first matching rule."""
+        serializer = RepricingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = reprice_products(
+                serializer.get_rules(),
+                user=request.user,
+                dry_run=serializer.validated_data['dry_run']
+            )
+        except ValueError as error:
+            return Response({'rules': [str(error)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'matched': result.matched,
+            'updated': result.updated,
+            'dry_run': serializer.validated_data['dry_run'],
+            'preview': result.preview,
+        })
 
 
 class ProductImageViewSet(viewsets.ModelViewSet):
@@ -48,4 +305,4 @@ class ProductImageViewSet(viewsets.ModelViewSet):
     serializer_class = ProductImageSerializer
     
     def get_queryset(self):
-        return super().get_queryset().select_related('product')
+        return super().get_queryset().select_related('product').defer('product__search_vector')
@@ -5,6 +5,8 @@ from django.contrib import admin
 from django.contrib.admin import display
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
+from products.cache import invalidate_products
+from products.models import Product
 from .models import Review
 from simple_history.admin import SimpleHistoryAdmin
 
@@ -72,12 +74,17 @@ class ReviewAdmin(SimpleHistoryAdmin):
         return format_html('<span style="color: orange;">⏳ на модерации</span>')
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user', 'product')
+        return super().get_queryset(request).select_related('user', 'product').defer('product__search_vector')
     
     actions = ['approve_reviews']
     
     @admin.action(description='одобрить выбранные отзывы')
     def approve_reviews(self, request, queryset):
         # одобрение выбранных отзывов
+        # update() не отправляет сигналы, поэтому рейтинг товаров пересчитывается явно
+        product_ids = set(queryset.filter(is_moderated=False).values_list('product_id', flat=True))
         updated = queryset.update(is_moderated=True)
+        if product_ids:
+            Product.objects.filter(pk__in=product_ids).refresh_ratings()
+            invalidate_products(*product_ids)
         self.message_user(request, f'{updated} отзывов одобрено.')
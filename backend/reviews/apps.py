@@ -0,0 +1,15 @@
+"""
+конфигурация приложения отзывов
+"""
+from django.apps import AppConfig
+
+
+class ReviewsConfig(AppConfig):
+    # конфигурация приложения отзывов
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'reviews'
+    verbose_name = 'отзывы'
+    
+    def ready(self):
+        # подключение обработчиков сигналов
+        from . import signals  # noqa: F401
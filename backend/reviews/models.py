@@ -39,6 +39,11 @@ class Review(models.Model):
         verbose_name_plural = 'отзывы'
         ordering = ['-created_at']
         unique_together = ('user', 'product')
+        indexes = [
+            # индексы под keyset-пагинацию отзывов товара и пользователя
+            models.Index(fields=['product', 'created_at', 'id'], name='reviews_product_created_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='reviews_user_created_idx'),
+        ]
     
     def __str__(self):
         return f'{self.user.email} - {self.product.name} ({self.rating}★)'
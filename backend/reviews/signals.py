@@ -0,0 +1,68 @@
+"""
+обработчики сигналов приложения отзывов
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from products.cache import invalidate_products
+from products.models import Product
+from .models import Review
+
+# поля отзыва, от которых зависят агрегаты рейтинга товара
+RATING_FIELDS = {'product_id', 'rating', 'is_moderated'}
+# состояние отзыва, загруженного без полей рейтинга (.only()/.defer())
+UNKNOWN = object()
+
+
+def get_rating_state(review):
+    # вклад отзыва в агрегаты рейтинга: (товар, оценка) или None
+    if review.is_moderated and review.product_id and review.rating:
+        return review.product_id, review.rating
+    return None
+
+
+def apply_rating_change(old_state, new_state, product_id=None):
+    # перенос вклада отзыва между оценками и товарами
+    if old_state is UNKNOWN:
+        # прежний вклад неизвестен: пересчёт рейтинга товара по отзывам
+        Product.objects.filter(pk=product_id).refresh_ratings()
+        invalidate_products(product_id)
+        return
+    if old_state == new_state:
+        return
+    changes = {}
+    if old_state is not None:
+        changes.setdefault(old_state[0], {})[old_state[1]] = -1
+    if new_state is not None:
+        by_rating = changes.setdefault(new_state[0], {})
+        by_rating[new_state[1]] = by_rating.get(new_state[1], 0) + 1
+    for product_id, by_rating in changes.items():
+        if Product.objects.filter(pk=product_id).apply_rating_changes(by_rating):
+            invalidate_products(product_id)
+
+
+@receiver(post_init, sender=Review)
+def remember_review_rating_state(sender, instance, **kwargs):
+    # состояние отзыва на момент загрузки для расчёта разницы при сохранении
+    if instance.pk is None:
+        instance._rating_state = None
+    elif RATING_FIELDS & instance.get_deferred_fields():
+        instance._rating_state = UNKNOWN
+    else:
+        instance._rating_state = get_rating_state(instance)
+
+
+@receiver(post_save, sender=Review)
+def update_product_rating_on_save(sender, instance, created, **kwargs):
+    # инкрементальное обновление рейтинга при создании, правке и модерации
+    new_state = get_rating_state(instance)
+    apply_rating_change(
+        None if created else instance._rating_state, new_state, instance.product_id
+    )
+    instance._rating_state = new_state
+
+
+@receiver(post_delete, sender=Review)
+def update_product_rating_on_delete(sender, instance, **kwargs):
+    # удалённый отзыв больше не учитывается в рейтинге
+    apply_rating_change(instance._rating_state, None, instance.product_id)
+    instance._rating_state = None
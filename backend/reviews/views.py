@@ -6,6 +6,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
+from core.pagination import OptionalKeysetPagination
 from .models import Review
 from .serializers import ReviewSerializer
 
@@ -14,6 +15,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
     """ViewSet for Review model."""
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalKeysetPagination
     
     def get_queryset(self):
         """Get reviews for a specific product or user."""
@@ -4,8 +4,10 @@ Views for users app.
 from rest_framework import viewsets, status, generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import get_user_model
+from carts.guest import GUEST_CART_HEADER, merge_guest_cart
 from .models import Role, UserRole, UserProfile
 from .serializers import (
     CustomTokenObtainPairSerializer,
@@ -21,8 +23,18 @@ User = get_user_model()
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
-    """Custom token view with user info."""
+    """Custom token view with user info; merges the guest cart sent in X-Cart-Token."""
     serializer_class = CustomTokenObtainPairSerializer
+    
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0]) from e
+        # гостевая корзина переносится в корзину пользователя одним upsert
+        merge_guest_cart(serializer.user, request.headers.get(GUEST_CART_HEADER))
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
 
 
 class UserCreateAPIView(generics.CreateAPIView):